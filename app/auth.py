@@ -0,0 +1,95 @@
+import threading
+import time
+import bcrypt
+from sqlalchemy import select
+from model import User
+import settings
+
+# Password hashing and login checks. Both cost a deliberate amount of CPU,
+# so the controllers run them on a worker thread, never on the UI thread.
+#
+# The bcrypt cost is calibrated per machine: one hash is timed at the
+# lowest cost and the cost raised while the estimate (each step doubles
+# it) stays within the target latency. The result is kept in the machine's
+# settings along with the target it was measured for, so it is only
+# measured again when the target changes. A login whose stored hash has a
+# lower cost is rehashed with the password the user just typed; hashes are
+# never weakened to a lower cost.
+
+# Target time for one hash, unless set under auth/target_ms
+DEFAULT_TARGET_MS = 250
+# Never below bcrypt's default cost, which the existing hashes were made
+# with, nor beyond a few seconds
+MIN_ROUNDS = 12
+MAX_ROUNDS = 16
+
+calibration_lock = threading.Lock()
+dummy_hash = None
+
+
+def target_ms() -> int:
+    return settings.get('auth/target_ms', DEFAULT_TARGET_MS, type=int)
+
+def is_calibrated() -> bool:
+    return (
+        settings.get('auth/rounds', 0, type=int) >= MIN_ROUNDS
+        and settings.get('auth/calibrated_ms', 0, type=int) == target_ms()
+    )
+
+
+def calibrate() -> int:
+    target = target_ms()
+    started = time.perf_counter()
+    bcrypt.hashpw(b'calibration', bcrypt.gensalt(MIN_ROUNDS))
+    estimate = (time.perf_counter() - started) * 1000
+
+    rounds = MIN_ROUNDS
+    while rounds < MAX_ROUNDS and estimate * 2 <= target:
+        rounds += 1
+        estimate *= 2
+    settings.put('auth/rounds', rounds)
+    settings.put('auth/calibrated_ms', target)
+    return rounds
+
+def work_factor() -> int:
+    with calibration_lock:
+        if not is_calibrated():
+            return calibrate()
+        return settings.get('auth/rounds', type=int)
+
+
+def hash_password(password: str) -> bytes:
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(work_factor()))
+
+def as_bytes(hashed) -> bytes:
+    return hashed.encode('utf-8') if isinstance(hashed, str) else hashed
+
+def hash_rounds(hashed) -> int:
+    # $2b$<cost>$<salt and hash>
+    return int(as_bytes(hashed).split(b'$')[2])
+
+def check_password(password: str, hashed) -> bool:
+    try:
+        return bcrypt.checkpw(password.encode('utf-8'), as_bytes(hashed))
+    except ValueError:
+        # Not a bcrypt hash
+        return False
+
+
+def authenticate(session, username, password):
+    # The id of the user these credentials belong to, or None
+    global dummy_hash
+    user = session.scalars(select(User).where(User.username == username)).first()
+    if user is None or not user.password:
+        # Checked anyway, so an unknown username takes as long as a known one
+        if dummy_hash is None:
+            dummy_hash = hash_password('')
+        check_password(password, dummy_hash)
+        return None
+    if not check_password(password, user.password):
+        return None
+
+    if hash_rounds(user.password) < work_factor():
+        user.password = hash_password(password)
+        session.commit()
+    return user.id
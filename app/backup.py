@@ -0,0 +1,262 @@
+import gzip
+import hashlib
+import os
+import shutil
+import sqlite3
+import tempfile
+import zlib
+from datetime import datetime, timedelta
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Online backups of the live database. The snapshot is taken through
+# SQLite's backup API a few pages at a time, so the app keeps reading and
+# writing while it runs and the copy is always consistent (a plain file
+# copy can catch a half-written page). VACUUM INTO writes a compacted
+# snapshot instead, in one step. The snapshot can then be compressed.
+
+PAGES_PER_STEP = 256
+CHUNK_SIZE = 1024 * 1024
+
+COMPRESSIONS = {
+    'None': '',
+    'gzip': '.gz',
+}
+if zstandard is not None:
+    COMPRESSIONS['zstd'] = '.zst'
+
+
+def compression_of(path) -> str:
+    for compression, extension in COMPRESSIONS.items():
+        if extension and path.endswith(extension):
+            return compression
+    return 'None'
+
+def open_compressed(path, mode, compression):
+    if compression == 'gzip':
+        return gzip.open(path, mode, compresslevel=6)
+    if compression == 'zstd':
+        if zstandard is None:
+            raise RuntimeError("zstd support is not installed")
+        if 'r' in mode:
+            return zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True)
+        return zstandard.ZstdCompressor().stream_writer(open(path, 'wb'), closefd=True)
+    return open(path, mode)
+
+
+def copy_stream(source, destination, progress=None, total=0):
+    done = 0
+    while chunk := source.read(CHUNK_SIZE):
+        destination.write(chunk)
+        done += len(chunk)
+        if progress:
+            progress(done, total)
+
+
+def snapshot(source_path, destination_path, compact=False, progress=None):
+    # Consistent uncompressed copy of the database at source_path
+    source = sqlite3.connect(source_path)
+    try:
+        if compact:
+            source.execute("VACUUM INTO ?", (destination_path,))
+            return
+
+        destination = sqlite3.connect(destination_path)
+        try:
+            def step(status, remaining, total):
+                if progress:
+                    progress(total - remaining, total)
+            source.backup(destination, pages=PAGES_PER_STEP, progress=step)
+        finally:
+            destination.close()
+    finally:
+        source.close()
+
+
+def backup_database(source_path, folder, name, compact=False, compression='None', progress=None) -> str:
+    # Writes folder/name.sqlite[.gz|.zst] and returns its path. progress
+    # receives (stage, done, total) with stage 'Copying' or 'Compressing'.
+    destination = os.path.join(folder, name + '.sqlite' + COMPRESSIONS[compression])
+    part = destination + '.part'
+    plain = os.path.join(folder, name + '.sqlite.part')
+
+    def report(stage):
+        return (lambda done, total: progress(stage, done, total)) if progress else None
+
+    try:
+        snapshot(source_path, plain, compact, report('Copying'))
+
+        if compression != 'None':
+            with open(plain, 'rb') as src, open_compressed(part, 'wb', compression) as dst:
+                copy_stream(src, dst, report('Compressing'), os.path.getsize(plain))
+            os.remove(plain)
+        else:
+            part = plain
+
+        # Only a complete backup ever carries the final name
+        os.replace(part, destination)
+        return destination
+    finally:
+        for leftover in (part, plain):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+
+
+def restore_copy(backup_path, destination_path):
+    # Copies a backup, compressed or not, to destination_path
+    with open_compressed(backup_path, 'rb', compression_of(backup_path)) as src, \
+            open(destination_path, 'wb') as dst:
+        shutil.copyfileobj(src, dst, CHUNK_SIZE)
+
+
+# Scheduled snapshots. Each snapshot is cut into fixed-size chunks kept in
+# a store database by content hash, so a snapshot only adds the chunks
+# that changed since the ones before it, and a snapshot identical to the
+# last one is not stored at all. Old snapshots are thinned out by the
+# retention policy and chunks no snapshot uses any more are dropped.
+
+SNAPSHOT_CHUNK = 64 * 1024
+STORE_NAME = 'snapshots.sqlite'
+
+# (age limit, spacing): the newest snapshot in every spacing-long window
+# is kept while younger than the limit; older snapshots are removed
+RETENTION = [
+    (timedelta(days=1), timedelta(hours=1)),
+    (timedelta(days=30), timedelta(days=1)),
+]
+
+STORE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS chunks (hash TEXT PRIMARY KEY, data BLOB NOT NULL);
+CREATE TABLE IF NOT EXISTS snapshots (id INTEGER PRIMARY KEY, taken_at TEXT NOT NULL, size INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS snapshot_chunks (
+    snapshot_id INTEGER NOT NULL REFERENCES snapshots(id),
+    position INTEGER NOT NULL,
+    hash TEXT NOT NULL REFERENCES chunks(hash),
+    PRIMARY KEY (snapshot_id, position)
+);
+CREATE INDEX IF NOT EXISTS ix_snapshot_chunks_hash ON snapshot_chunks(hash);
+"""
+
+def open_store(store_path):
+    store = sqlite3.connect(store_path)
+    store.executescript(STORE_SCHEMA)
+    return store
+
+
+def take_snapshot(source_path, store_path, now=None):
+    # Returns the new snapshot id, or None when nothing changed
+    now = now or datetime.now()
+    fd, copy_path = tempfile.mkstemp(suffix='.part', dir=os.path.dirname(os.path.abspath(store_path)))
+    os.close(fd)
+    store = open_store(store_path)
+    try:
+        snapshot(source_path, copy_path)
+
+        hashes = []
+        with store, open(copy_path, 'rb') as copy:
+            while chunk := copy.read(SNAPSHOT_CHUNK):
+                digest = hashlib.sha256(chunk).hexdigest()
+                hashes.append(digest)
+                if store.execute("SELECT 1 FROM chunks WHERE hash = ?", (digest,)).fetchone() is None:
+                    store.execute("INSERT INTO chunks (hash, data) VALUES (?, ?)", (digest, zlib.compress(chunk)))
+
+            last = store.execute("SELECT id FROM snapshots ORDER BY taken_at DESC, id DESC LIMIT 1").fetchone()
+            if last is not None:
+                last_hashes = [row[0] for row in store.execute(
+                    "SELECT hash FROM snapshot_chunks WHERE snapshot_id = ? ORDER BY position", last
+                )]
+                if last_hashes == hashes:
+                    return None
+
+            snapshot_id = store.execute(
+                "INSERT INTO snapshots (taken_at, size) VALUES (?, ?)",
+                (now.isoformat(timespec='seconds'), os.path.getsize(copy_path))
+            ).lastrowid
+            store.executemany(
+                "INSERT INTO snapshot_chunks (snapshot_id, position, hash) VALUES (?, ?, ?)",
+                [(snapshot_id, position, digest) for position, digest in enumerate(hashes)]
+            )
+            return snapshot_id
+    finally:
+        store.close()
+        os.remove(copy_path)
+
+
+def expired_snapshots(snapshots, now) -> list:
+    # snapshots: (id, taken_at) pairs; returns the ids the policy drops
+    snapshots = sorted(snapshots, key=lambda snapshot: snapshot[1], reverse=True)
+    keep = {snapshots[0][0]} if snapshots else set()
+    windows = set()
+    for snapshot_id, taken_at in snapshots:
+        for limit, spacing in RETENTION:
+            if now - taken_at <= limit:
+                window = (spacing, int(taken_at.timestamp() // spacing.total_seconds()))
+                if window not in windows:
+                    windows.add(window)
+                    keep.add(snapshot_id)
+                break
+    return [snapshot_id for snapshot_id, _ in snapshots if snapshot_id not in keep]
+
+
+def prune_snapshots(store_path, now=None) -> int:
+    now = now or datetime.now()
+    store = open_store(store_path)
+    try:
+        with store:
+            snapshots = [
+                (snapshot_id, datetime.fromisoformat(taken_at))
+                for snapshot_id, taken_at in store.execute("SELECT id, taken_at FROM snapshots")
+            ]
+            expired = [(snapshot_id,) for snapshot_id in expired_snapshots(snapshots, now)]
+            store.executemany("DELETE FROM snapshot_chunks WHERE snapshot_id = ?", expired)
+            store.executemany("DELETE FROM snapshots WHERE id = ?", expired)
+            store.execute("DELETE FROM chunks WHERE hash NOT IN (SELECT hash FROM snapshot_chunks)")
+        if expired:
+            store.execute("VACUUM")
+        return len(expired)
+    finally:
+        store.close()
+
+
+def scheduled_backup(source_path, folder, now=None):
+    # One run of the scheduler: snapshot, then apply the retention policy
+    os.makedirs(folder, exist_ok=True)
+    store_path = os.path.join(folder, STORE_NAME)
+    snapshot_id = take_snapshot(source_path, store_path, now)
+    prune_snapshots(store_path, now)
+    return snapshot_id
+
+
+def list_snapshots(store_path) -> list:
+    # (id, taken_at, size), newest first
+    store = open_store(store_path)
+    try:
+        return [
+            (snapshot_id, datetime.fromisoformat(taken_at), size)
+            for snapshot_id, taken_at, size in store.execute(
+                "SELECT id, taken_at, size FROM snapshots ORDER BY taken_at DESC, id DESC"
+            )
+        ]
+    finally:
+        store.close()
+
+
+def restore_snapshot(store_path, snapshot_id, destination_path):
+    part = destination_path + '.part'
+    store = open_store(store_path)
+    try:
+        with open(part, 'wb') as destination:
+            for (data,) in store.execute(
+                "SELECT c.data FROM snapshot_chunks sc JOIN chunks c ON c.hash = sc.hash "
+                "WHERE sc.snapshot_id = ? ORDER BY sc.position", (snapshot_id,)
+            ):
+                destination.write(zlib.decompress(data))
+        os.replace(part, destination_path)
+    finally:
+        store.close()
+        if os.path.exists(part):
+            os.remove(part)
+
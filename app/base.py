@@ -1,23 +1,209 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from functools import wraps
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker, declarative_base, scoped_session
+from migrations import migrate
+import backup
+import settings
 
 
 Base = declarative_base()
 
 database_url = 'sqlite:///main.sqlite'
 
+# PRAGMAs run on every new SQLite connection. WAL lets the list windows
+# read while a save is being written, and with synchronous=NORMAL a commit
+# no longer waits on fsync (a power cut can lose the last commits, never
+# corrupt the file). 'Compatibility' keeps the rollback journal for
+# databases on network shares, where WAL does not work.
+ENGINE_PROFILES = {
+    'Balanced': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'mmap_size': 64 * 1024 * 1024,
+        'cache_size': -16000,  # KiB
+        'temp_store': 'MEMORY',
+        'foreign_keys': 'ON',
+    },
+    'Performance': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'mmap_size': 256 * 1024 * 1024,
+        'cache_size': -64000,
+        'temp_store': 'MEMORY',
+        'foreign_keys': 'ON',
+    },
+    'Safe': {
+        'journal_mode': 'WAL',
+        'synchronous': 'FULL',
+        'mmap_size': 0,
+        'cache_size': -8000,
+        'temp_store': 'MEMORY',
+        'foreign_keys': 'ON',
+    },
+    'Compatibility': {
+        'journal_mode': 'DELETE',
+        'synchronous': 'FULL',
+        'mmap_size': 0,
+        'cache_size': -2000,
+        'temp_store': 'DEFAULT',
+        'foreign_keys': 'ON',
+    },
+}
+
+DEFAULT_PROFILE = 'Balanced'
+
+# A file without these is not a BRIMA database, whatever else it holds
+REQUIRED_TABLES = {'households', 'residents', 'users'}
+
+def engine_profile() -> str:
+    profile = settings.get('database/profile', DEFAULT_PROFILE)
+    return profile if profile in ENGINE_PROFILES else DEFAULT_PROFILE
+
+def set_journal_mode(cursor, mode):
+    # The journal mode is stored in the file and can only change while no
+    # other connection is open; if one is, keep the current mode until the
+    # next start instead of waiting on the lock
+    if cursor.execute("PRAGMA journal_mode").fetchone()[0].upper() == mode:
+        return
+    timeout = cursor.execute("PRAGMA busy_timeout").fetchone()[0]
+    cursor.execute("PRAGMA busy_timeout = 0")
+    try:
+        cursor.execute(f"PRAGMA journal_mode = {mode}")
+    except sqlite3.OperationalError:
+        pass
+    finally:
+        cursor.execute(f"PRAGMA busy_timeout = {timeout}")
+
 class Database:
     _instance = None
     engine = None
     Session = None
+    profile = DEFAULT_PROFILE
+    # Called after switch_to, to drop anything cached from the old file
+    switch_listeners = []
 
     def __new__(cls, db_url=database_url):
         if not cls._instance:
             cls._instance = super().__new__(cls)
-            cls._instance.engine = create_engine(db_url)
+            cls._instance.profile = engine_profile()
+            cls._instance.engine = cls._instance.make_engine(db_url)
             cls._instance.Session = sessionmaker(bind=cls._instance.engine)
-            Base.metadata.create_all(cls._instance.engine)
+            # The session of the running unit of work, one per thread
+            cls._instance.sessions = scoped_session(cls._instance.get_session)
+            cls._instance.local = threading.local()
+            cls._instance.prepare()
         return cls._instance
+
+    def prepare(self):
+        Base.metadata.create_all(self.engine)
+        migrate(self.engine, Base.metadata)
+
+    def make_engine(self, db_url):
+        engine = create_engine(db_url)
+
+        @event.listens_for(engine, 'connect')
+        def set_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            for name, value in ENGINE_PROFILES[self.profile].items():
+                if name == 'journal_mode':
+                    set_journal_mode(cursor, value)
+                else:
+                    cursor.execute(f"PRAGMA {name} = {value}")
+            cursor.close()
+
+        return engine
+
+    def switch_to(self, source_path):
+        # Replaces the database file with source_path (a backup, possibly
+        # compressed) while the app keeps running. Callers must make sure no
+        # background job is using the database.
+        target = self.engine.url.database
+        part = target + '.part'
+
+        # Copy and check the new file before touching the current one
+        try:
+            backup.restore_copy(source_path, part)
+            check = sqlite3.connect(part)
+            try:
+                result = check.execute("PRAGMA quick_check").fetchone()[0]
+                tables = {name for (name,) in check.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+            except sqlite3.DatabaseError as e:
+                raise ValueError("The selected file is not a valid BRIMA database.") from e
+            finally:
+                check.close()
+            if result != 'ok':
+                raise ValueError(f"The selected file is not a healthy database: {result}")
+            if not REQUIRED_TABLES <= tables:
+                raise ValueError("The selected file is not a valid BRIMA database.")
+        except BaseException:
+            if os.path.exists(part):
+                os.remove(part)
+            raise
+
+        # Close every pooled connection; the last one to close folds the WAL
+        # into the old file. Leftover -wal/-shm files would otherwise be
+        # replayed over the new one.
+        self.sessions.remove()
+        self.engine.dispose()
+        for suffix in ('-wal', '-shm', '-journal'):
+            if os.path.exists(target + suffix):
+                os.remove(target + suffix)
+        os.replace(part, target)
+
+        # Sessions made from now on, by any controller or thread, use the new file
+        self.engine = self.make_engine(self.engine.url)
+        self.Session = sessionmaker(bind=self.engine)
+        self.prepare()
+
+        for listener in self.switch_listeners:
+            listener()
+
+    def set_profile(self, profile):
+        # Saved for the next start; pooled connections are dropped so new
+        # ones pick up the PRAGMAs right away
+        self.profile = profile
+        settings.put('database/profile', profile)
+        self.engine.dispose()
+
+    def checkpoint(self, mode='PASSIVE'):
+        # Moves WAL pages into the main file; TRUNCATE also empties the WAL
+        with self.engine.connect() as conn:
+            conn.exec_driver_sql(f"PRAGMA wal_checkpoint({mode})")
+
+    def maintain(self):
+        # Run periodically and on exit: checkpoint, then refresh planner statistics
+        self.checkpoint()
+        with self.engine.connect() as conn:
+            conn.exec_driver_sql("PRAGMA optimize")
+            conn.commit()
     
     def get_session(self):
-        return self.Session()
\ No newline at end of file
+        return self.Session()
+
+    @contextmanager
+    def unit_of_work(self):
+        # Everything one user action does shares a session. Nested units
+        # reuse it; when the outermost one ends, anything left uncommitted
+        # is rolled back and the session is closed, so loaded objects never
+        # outlive the action that needed them.
+        depth = getattr(self.local, 'depth', 0)
+        self.local.depth = depth + 1
+        try:
+            yield self.sessions()
+        finally:
+            self.local.depth = depth
+            if depth == 0:
+                self.sessions.remove()
+
+
+def unit_of_work(method):
+    # Runs a controller action as one unit of work; use self.session inside
+    @wraps(method)
+    def wrapper(*args, **kwargs):
+        with Database().unit_of_work():
+            return method(*args, **kwargs)
+    return wrapper
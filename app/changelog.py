@@ -0,0 +1,30 @@
+from sqlalchemy import text
+
+# Triggers that record every change to the exported tables in change_log,
+# whether it comes from the ORM, a bulk import or any other connection.
+# Delta exports select the rows whose id was logged after the watermark
+# of the previous export; deletions are exported from the log itself.
+
+TRACKED_TABLES = ['households', 'residents', 'users', 'blotters', 'certificates']
+
+def log_statement(table_name, operation, row):
+    return (
+        "INSERT INTO change_log (table_name, row_id, operation, changed_at) "
+        f"VALUES ('{table_name}', {row}.id, '{operation}', datetime('now', 'localtime'))"
+    )
+
+# (trigger name, table, event, statement)
+TRIGGERS = [
+    trigger
+    for table_name in TRACKED_TABLES
+    for trigger in [
+        (f'{table_name}_log_ai', table_name, 'AFTER INSERT', log_statement(table_name, 'insert', 'NEW')),
+        (f'{table_name}_log_au', table_name, 'AFTER UPDATE', log_statement(table_name, 'update', 'NEW')),
+        (f'{table_name}_log_ad', table_name, 'AFTER DELETE', log_statement(table_name, 'delete', 'OLD')),
+    ]
+]
+
+
+def install_change_log(conn):
+    for name, table_name, event, statement in TRIGGERS:
+        conn.execute(text(f"CREATE TRIGGER IF NOT EXISTS {name} {event} ON {table_name} BEGIN {statement}; END"))
@@ -1,33 +1,51 @@
-from base import Database
+from base import Database, ENGINE_PROFILES, unit_of_work
 from model import Household, Resident, User, Blotter, Certificate, Barangay
 from forms import (AddHouseholdForm, AddResidentForm, BrowseResidentForm,
     UpdateHouseholdForm, BrowseHouseholdForm, UpdateResidentForm, AddUserForm,
     UpdateUserForm, BrowseUserForm, AddBlotterForm, UpdateBlotterForm, BrowseBlotterForm,
     AddCertificateForm, UpdateCertificateForm, BrowseCertificateForm, FilterHouseholdForm, FilterResidentForm, FilterUserForm,
-    FilterBlotterForm, FilterCertificateForm
+    FilterBlotterForm, FilterCertificateForm, BatchCertificateForm
 )
 from view import  BrimaView, MainView, LoginView
-from widgets import BaseWindow, AboutWindow, SettingsWindow, DashboardWindow
-from PySide6.QtWidgets import QMessageBox, QDialog, QFileDialog
-from PySide6.QtCore import Qt, QDate, QSize
+from widgets import BaseWindow, CertificateWindow, AboutWindow, SettingsWindow, DashboardWindow
+from paging import KeysetPager
+from workers import Worker
+import auth
+import fts
+import backup
+import documents
+import pdf
+import export
+import importer
+import settings
+import queries
+import stats
+from PySide6.QtWidgets import QApplication, QMessageBox, QDialog, QFileDialog, QInputDialog
+from PySide6.QtCore import Qt, QDate, QSize, QTimer, QThreadPool
 from PySide6.QtGui import QColor, QFont
 import pyqtgraph as pg
 from pyqtgraph import PlotWidget, BarGraphItem, TextItem
-from sqlalchemy import or_, and_, desc, select, create_engine, func
-from sqlalchemy.orm import aliased, sessionmaker, declarative_base, Session             
-from docx import Document
+from sqlalchemy import or_, and_, desc, select, func
+from sqlalchemy.orm import aliased, declarative_base, Session, contains_eager, joinedload             
 import os
-import shutil
+import logging
 from datetime import datetime, date
-import bcrypt
-import pandas as pd
 
+log = logging.getLogger(__name__)
 
+# Pause in typing after which the search bar runs its search
+SEARCH_DELAY_MS = 300
+
+# How often the WAL is checkpointed and the planner statistics refreshed
+MAINTENANCE_INTERVAL_MS = 10 * 60 * 1000
+
+# Minutes between automatic snapshots unless set in Settings (0 turns them off)
+DEFAULT_BACKUP_INTERVAL = 60
 
 class MainController:
     def __init__(self, view: MainView):
         self.db = Database()
-        self.session = self.db.get_session()
+        self.session = self.db.sessions
         self.view = view
         self.user = None
         self.brima = self.view.brima
@@ -36,10 +54,87 @@ class MainController:
         self.brima.btLogout.clicked.connect(self.logout)
         self.view.stack.setCurrentIndex(0)
 
+        # Periodic database upkeep, run in the background
+        self.worker = Worker(self.view)
+        self.maintenance_timer = QTimer(self.view)
+        self.maintenance_timer.setInterval(MAINTENANCE_INTERVAL_MS)
+        self.maintenance_timer.timeout.connect(self.maintain_database)
+        self.maintenance_timer.start()
+        QApplication.instance().aboutToQuit.connect(self.shutdown)
+
+        # Automatic snapshots, see backup.scheduled_backup
+        self.backup_failures = 0
+        self.backup_timer = QTimer(self.view)
+        self.backup_timer.timeout.connect(self.scheduled_backup)
+        self.schedule_backups()
+
+        # Measures the password hashing cost for this machine, see auth.py
+        if not auth.is_calibrated():
+            self.worker.submit('calibrate', lambda session: auth.work_factor())
+
+    def maintain_database(self):
+        self.worker.submit('maintenance', lambda session: self.db.maintain())
+
+    def shutdown(self):
+        # Last upkeep on exit, once the background jobs have finished
+        self.maintenance_timer.stop()
+        self.backup_timer.stop()
+        QThreadPool.globalInstance().waitForDone()
+        try:
+            self.db.maintain()
+        except Exception as e:
+            log.warning("Database maintenance on exit failed: %s", e)
+
+    def schedule_backups(self):
+        minutes = settings.get('backup/interval', DEFAULT_BACKUP_INTERVAL, type=int)
+        if minutes > 0:
+            self.backup_timer.start(minutes * 60 * 1000)
+        else:
+            self.backup_timer.stop()
+
+    def snapshot_folder(self) -> str:
+        default = os.path.join(os.path.dirname(os.path.abspath(self.db.engine.url.database)), 'snapshots')
+        return settings.get('backup/folder', default)
+
+    def scheduled_backup(self):
+        source_db_path = self.db.engine.url.database
+        folder = self.snapshot_folder()
+        self.worker.submit(
+            'scheduled_backup',
+            lambda session: backup.scheduled_backup(source_db_path, folder),
+            self.scheduled_backup_finished,
+            self.scheduled_backup_failed
+        )
+
+    def scheduled_backup_finished(self, snapshot_id):
+        self.backup_failures = 0
+
+    def scheduled_backup_failed(self, error):
+        # Only the first failure in a row is shown; the timer keeps trying
+        # unattended, so the rest are logged instead of stacking dialogs
+        self.backup_failures += 1
+        if self.backup_failures == 1:
+            QMessageBox.warning(self.view, "Automatic Backup Failed", str(error))
+        else:
+            log.warning("Automatic backup failed (%d in a row): %s", self.backup_failures, error)
+
     def login(self):
         data = self.view.login.get_fields()
-        user = self.is_valid_login(self.session, data)
-        
+        username, password = data.get('username'), data.get('password')
+        # bcrypt takes a noticeable moment; keep the window responsive
+        self.view.login.btLogin.setEnabled(False)
+        self.worker.submit(
+            'login',
+            lambda session: auth.authenticate(session, username, password),
+            self.login_finished,
+            self.login_failed
+        )
+
+    @unit_of_work
+    def login_finished(self, user_id):
+        self.view.login.btLogin.setEnabled(True)
+        user = self.session.get(User, user_id) if user_id is not None else None
+
         if user:
             QMessageBox.information(self.view, 'Success', 'Login Sucessful!')
             self.view.login.tbUsername.clear()
@@ -54,13 +149,9 @@ class MainController:
         else:
             QMessageBox.critical(self.view, 'Invalid Credentials', 'Please input valid credentials')
 
-    def is_valid_login(self, session: Session, data: dict) -> User:
-        user = session.query(User).filter(User.username==data.get('username')).first()
-
-        if user and bcrypt.checkpw(data.get('password').encode('utf-8'), user.password):
-            return user
-        else:
-            return None
+    def login_failed(self, error):
+        self.view.login.btLogin.setEnabled(True)
+        QMessageBox.critical(self.view, 'Login Failed', str(error))
 
     def logout(self):
         
@@ -86,7 +177,7 @@ class MainController:
 class BrimaController:
     def __init__(self, view : BrimaView, user, parent: MainController):
         self.db = Database()
-        self.session = self.db.get_session()
+        self.session = self.db.sessions
         self.view = view
         self.user = user 
 
@@ -143,7 +234,8 @@ class BrimaController:
             for btn in (win.btAdd, win.btEdit, win.btDelete):
                 btn.setVisible(False)
 
-        for btn in (view.settings_window.edit_barangay, view.settings_window.backup):
+        for btn in (view.settings_window.edit_barangay, view.settings_window.backup,
+                    view.settings_window.performance):
             btn.setEnabled(False)
 
     def setup_admin(self, view: BrimaView) -> None:
@@ -157,20 +249,37 @@ class BrimaController:
             for btn in (win.btAdd, win.btEdit, win.btDelete):
                 btn.setVisible(True)
     
-        for btn in (view.settings_window.edit_barangay, view.settings_window.backup):
+        for btn in (view.settings_window.edit_barangay, view.settings_window.backup,
+                    view.settings_window.performance):
             btn.setEnabled(True)
 
 class BaseController:
+    headers = []
+    rows: queries.RowQuery = None
+
     def __init__(self, view: BaseWindow):
         self.db = Database()
-        self.session = self.db.get_session()
+        self.session = self.db.sessions
         self.view = view
-        self.current_filter = self.default_filter()
+        self.worker = Worker(self.view)
+        self.worker.busy_changed.connect(self.view.set_busy)
+        self.view.model.set_fetcher(self.fetch_page)
+        # Search terms of the rows on screen, while they are a full search result
+        self.shown_search = None
+        with self.db.unit_of_work():
+            self.current_filter = self.default_filter()
         self.refresh()
+
+        # Live search: typing searches once the user pauses
+        self.search_timer = QTimer(self.view)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(SEARCH_DELAY_MS)
+        self.search_timer.timeout.connect(self.run_search)
+        self.view.tbSearchBar.textEdited.connect(self.search_timer.start)
         
         self.view.btRefresh.clicked.connect(self.refresh)
-        self.view.btSearch.clicked.connect(self.search)
-        self.view.tbSearchBar.returnPressed.connect(self.search)
+        self.view.btSearch.clicked.connect(self.run_search)
+        self.view.tbSearchBar.returnPressed.connect(self.run_search)
         self.view.btAdd.clicked.connect(self.add)
         self.view.btEdit.clicked.connect(self.edit)
         self.view.btDelete.clicked.connect(self.delete)
@@ -180,6 +289,67 @@ class BaseController:
     def default_filter(self):
         pass
 
+    def make_pager(self, query) -> KeysetPager:
+        return self.rows.pager(query)
+
+    def load_query(self, query, show_total=False):
+        self.load_pager(self.make_pager(query), show_total)
+
+    def load_pager(self, pager: KeysetPager, show_total=False, search_terms=None):
+        # The first page is fetched on a pool thread; later pages are pulled
+        # in by the table as it scrolls. A newer load cancels this one.
+        def first_page(session):
+            data = pager.next_page(session)
+            return data, pager.count(session) if show_total else None
+
+        self.shown_search = None
+        self.worker.submit(
+            'list', first_page,
+            lambda result: self.show_page(pager, *result, search_terms=search_terms),
+            self.show_error
+        )
+
+    def fetch_page(self, pager: KeysetPager, on_page, on_error):
+        # Later pages, requested by the table as it scrolls to the bottom
+        def failed(error):
+            on_error(error)
+            self.show_error(error)
+
+        self.worker.submit('page', lambda session: pager.next_page(session), on_page, failed)
+
+    def show_page(self, pager: KeysetPager, data, total=None, search_terms=None):
+        if total is not None:
+            self.view.lbTotal.setText(f"Total: {total}")
+        self.view.load_table(self.headers, data, pager)
+        self.shown_search = search_terms
+
+    def show_error(self, error):
+        QMessageBox.critical(self.view, "Error", f"Failed to load records: {str(error)}")
+
+    def run_search(self):
+        self.search_timer.stop()
+        self.search()
+
+    def search_index(self, index: fts.SearchIndex):
+        search_text = self.view.get_search_text()
+        match = fts.match_query(search_text)
+
+        if not match:
+            self.load_query(self.current_filter)
+            return
+
+        # A search that only narrows the one on screen is answered from the
+        # loaded rows, which carry the indexed text in a hidden last column
+        terms = fts.search_terms(search_text)
+        if fts.narrows(self.shown_search, terms) and self.view.model.is_complete():
+            self.view.model.filter_rows(len(self.rows.columns), lambda text: fts.matches(text, terms))
+            self.shown_search = terms
+            return
+
+        # Best matches first
+        query, rank = index.search(self.current_filter, self.rows.id_column, match)
+        self.load_pager(self.rows.ranked_pager(query, rank, index.text()), search_terms=terms)
+
     def refresh(self):
         pass
 
@@ -208,70 +378,25 @@ class BaseController:
         pass
 
 class HouseholdWindowController(BaseController):
+    headers = ['id', 'Date Added', 'Household Name', 'Address']
+    rows = queries.HOUSEHOLD_ROWS
+
     def __init__(self, view: BaseWindow):
         super().__init__(view)
 
     def default_filter(self):
         return self.session.query(Household).order_by(Household.household_name)
         
+    @unit_of_work
     def refresh(self):
         self.view.set_search_text('')
-        households = self.current_filter.all()
-        data = []
-        for household in households:
-            result = [
-                household.id,
-                household.date_added,
-                household.household_name,
-                f"{household.house_no} {household.street} {household.sitio} {household.landmark}"
-            ]
-            data.append(result)
-        self.view.lbTotal.setText(f"Total: {len(data)}") 
-        self.view.load_table(['id', 'Date Added', 'Household Name', 'Address'], data)
+        self.load_query(self.current_filter, show_total=True)
     
+    @unit_of_work
     def search(self):
-        search_text = self.view.get_search_text().lower()  
-        search_terms = search_text.split() 
-        
-        query = self.current_filter
-        
-        if search_terms:
-            conditions = []
-            for term in search_terms:
-                term_filter = or_(
-                    Household.date_added.ilike(f"%{term}%"),
-                    Household.household_name.ilike(f"%{term}%"),
-                    Household.house_no.ilike(f"%{term}%"),
-                    Household.street.ilike(f"%{term}%"),
-                    Household.sitio.ilike(f"%{term}%"),
-                    Household.landmark.ilike(f"%{term}%")
-                )
-                conditions.append(term_filter)
-            
-            query = query.filter(and_(*conditions))
-        
-        # Order and execute
-        households = query.order_by(Household.household_name).all()
-        
-        data = []
-        for household in households:
-            address = " ".join(filter(None, [
-                household.house_no,
-                household.street,
-                household.sitio,
-                household.landmark
-            ]))
-            
-            result = [
-                household.id,
-                household.date_added,
-                household.household_name,
-                address
-            ]
-            data.append(result)
-        
-        self.view.load_table(['id', 'Date Added', 'Household Name', 'Address'], data)
+        self.search_index(fts.HOUSEHOLDS)
     
+    @unit_of_work
     def add(self):
             add_form = AddHouseholdForm()
         
@@ -322,6 +447,7 @@ class HouseholdWindowController(BaseController):
             landmark = data.get("landmark", "").upper()
          )
 
+    @unit_of_work
     def edit(self):
         try:
             row_id = self.view.get_table_row()
@@ -392,6 +518,7 @@ class HouseholdWindowController(BaseController):
         
         update_form.accept()   
         
+    @unit_of_work
     def browse(self):
         try:
             row_id = self.view.get_table_row()
@@ -430,6 +557,7 @@ class HouseholdWindowController(BaseController):
                 browse_form.exec()
         
     
+    @unit_of_work
     def delete(self):
         try:
             row_id = self.view.get_table_row()
@@ -452,6 +580,7 @@ class HouseholdWindowController(BaseController):
                     self.session.commit()
                     self.refresh()
 
+    @unit_of_work
     def filter_settings(self):
         filter_form = FilterHouseholdForm()
         filter_form.filterbar.btCancel.clicked.connect(lambda: filter_form.reject)
@@ -485,111 +614,30 @@ class HouseholdWindowController(BaseController):
         self.apply_filter(form)
          
 class ResidentWindowController(BaseController):
+    headers = ['id', 'Date Added','Role', 'Full Name', 'Sex', 'Household Name', 'Birth Date', 'Civil Status', 'Remarks', 'Address']
+    rows = queries.RESIDENT_ROWS
+
     def __init__(self, view: BaseWindow, parent: BrimaController):
         super().__init__(view)
         self.parent = parent
         
     def default_filter(self):
-        return self.session.query(Resident).outerjoin(Resident.household).order_by(Resident.last_name)
+        return (
+            self.session.query(Resident)
+            .outerjoin(Resident.household)
+            .order_by(Resident.last_name)
+        )
     
+    @unit_of_work
     def refresh(self):
         self.view.set_search_text('')
-        residents = self.current_filter.all()
-        data = []
-        for resident in residents:
-            full_name = " ".join(filter(None, [resident.first_name, resident.middle_name, resident.suffix]))
-            full_name = f"{resident.last_name}, {full_name}".strip()
-
-            household = resident.household
-            household_name = household.household_name if household else "N/A"
-            address_parts = [
-                getattr(household, "house_no", ""),
-                getattr(household, "street", ""),
-                getattr(household, "sitio", ""),
-                getattr(household, "landmark", "")
-            ] if household else []
-
-            address = " ".join(filter(None, address_parts))
-
-            result = [
-                resident.id,
-                resident.date_added,
-                resident.role,
-                full_name,
-                resident.sex,
-                household_name,
-                resident.date_of_birth,
-                resident.civil_status,
-                resident.remarks,
-                address
-            ]
-            data.append(result)
-        self.view.lbTotal.setText(f"Total: {len(data)}") 
-        self.view.load_table(['id', 'Date Added','Role', 'Full Name', 'Sex', 'Household Name', 'Birth Date', 'Civil Status', 'Remarks', 'Address'], data)
+        self.load_query(self.current_filter, show_total=True)
 
+    @unit_of_work
     def search(self):
-        search_text = self.view.get_search_text().lower()
-        search_terms = search_text.split()
-
-        query = self.current_filter
-
-        if search_terms:
-            conditions = []
-            for term in search_terms:
-                term_filter = or_(
-                    Resident.date_added.ilike(f"%{term}%"),
-                    Resident.first_name.ilike(f"%{term}%"),
-                    Resident.middle_name.ilike(f"%{term}%"),
-                    Resident.last_name.ilike(f"%{term}%"),
-                    Resident.suffix.ilike(f"%{term}%"),
-                    Resident.role.ilike(f"%{term}%"),
-                    Household.household_name.ilike(f"%{term}%"),
-                    Household.house_no.ilike(f"%{term}%"),
-                    Household.street.ilike(f"%{term}%"),
-                    Household.sitio.ilike(f"%{term}%"),
-                    Household.landmark.ilike(f"%{term}%")
-                )
-                conditions.append(term_filter)
-            
-            query = query.filter(and_(*conditions))
-
-        residents = query.order_by(Resident.last_name).all()
-        data = []
-        for resident in residents:
-            full_name = " ".join(filter(None, [
-                resident.first_name,
-                resident.middle_name,
-                resident.suffix
-            ]))
-            full_name = f"{resident.last_name}, {full_name}".strip()
-
-            household = resident.household
-            household_name = household.household_name if household else "N/A"
-            address_parts = [
-                getattr(household, "house_no", ""),
-                getattr(household, "street", ""),
-                getattr(household, "sitio", ""),
-                getattr(household, "landmark", "")
-            ] if household else []
-
-            address = " ".join(filter(None, address_parts))
-
-            result = [
-                resident.id,
-                resident.date_added,
-                resident.role,
-                full_name,
-                resident.sex,
-                household_name,
-                resident.date_of_birth,
-                resident.civil_status,
-                resident.remarks,
-                address
-            ]
-            data.append(result)
-        
-        self.view.load_table(['id', 'Date Added','Role', 'Full Name', 'Sex', 'Household Name', 'Birth Date', 'Civil Status', 'Remarks', 'Address'], data)
+        self.search_index(fts.RESIDENTS)
     
+    @unit_of_work
     def add(self):
         add_form = AddResidentForm()
     
@@ -687,6 +735,7 @@ class ResidentWindowController(BaseController):
             view.form.tbLandmark.setText(household.landmark)
         
     
+    @unit_of_work
     def edit(self):
         try:
             row_id = self.view.get_table_row()
@@ -842,6 +891,7 @@ class ResidentWindowController(BaseController):
             self.session.rollback()
             QMessageBox.critical(update_form, "Error", f"Failed to update resident: {str(e)}")
         
+    @unit_of_work
     def browse(self):
         try:
             row_id = self.view.get_table_row()
@@ -888,6 +938,7 @@ class ResidentWindowController(BaseController):
                 browse_form.exec()
         
     
+    @unit_of_work
     def delete(self):
         try:
             row_id = self.view.get_table_row()
@@ -910,6 +961,7 @@ class ResidentWindowController(BaseController):
                     self.session.commit()
                     self.refresh()
 
+    @unit_of_work
     def filter_settings(self):
         filter_form = FilterResidentForm()
         filter_form.filterbar.btCancel.clicked.connect(lambda: filter_form.reject)
@@ -987,45 +1039,30 @@ class ResidentWindowController(BaseController):
         self.apply_filter(form)
 
 class UserWindowController(BaseController):
+    headers = ['id', 'Date Added', 'Username', 'Position', 'Full Name']
+    rows = queries.USER_ROWS
+
     def __init__(self, view: BaseWindow):
         super().__init__(view)
 
     def default_filter(self):
-        return self.session.query(User).outerjoin(User.resident).order_by(User.id, User.date_added)
+        return (
+            self.session.query(User)
+            .outerjoin(User.resident)
+            .order_by(User.id, User.date_added)
+        )
     
+    @unit_of_work
     def refresh(self):
         self.view.set_search_text('')
-        users = self.current_filter.all()
-        data = []
-        for user in users:
-            username = user.username
-            position = user.position
-            resident = user.resident
-            resident_name = [
-                getattr(resident, "first_name", ""),
-                getattr(resident, "middle_name", ""),
-                getattr(resident, "last_name", ""),
-                getattr(resident, "suffix", "")
-            ] if resident else []
-
-            full_name = " ".join(filter(None, resident_name))
-
-            result = [
-                user.id,
-                user.date_added,
-                username,
-                position,
-                full_name
-            ]
-            data.append(result)
-        self.view.lbTotal.setText(f"Total: {len(data)}") 
-        self.view.load_table(['id', 'Date Added', 'Username', 'Position', 'Full Name'], data)
+        self.load_query(self.current_filter, show_total=True)
 
+    @unit_of_work
     def search(self):
         search_text = self.view.get_search_text().lower()
         search_terms = search_text.split()
 
-        query = self.current_filter.join(User.resident)
+        query = self.current_filter
 
         if search_terms:
             conditions = []
@@ -1043,32 +1080,9 @@ class UserWindowController(BaseController):
             
             query = query.filter(and_(*conditions))
 
-        users = query.order_by(User.id, User.date_added).all()
-        data = []
-        for user in users:
-            username = user.username
-            position = user.position
-            resident = user.resident
-            resident_name = [
-                getattr(resident, "first_name", ""),
-                getattr(resident, "middle_name", ""),
-                getattr(resident, "last_name", ""),
-                getattr(resident, "suffix", "")
-            ] if resident else []
-
-            full_name = " ".join(filter(None, resident_name))
-
-            result = [
-                user.id,
-                user.date_added,
-                username,
-                position,
-                full_name
-            ]
-            data.append(result)
-        
-        self.view.load_table(['id', 'Date Added', 'Username', 'Position', 'Full Name'], data)
+        self.load_query(query)
     
+    @unit_of_work
     def add(self):
         add_form = AddUserForm()
     
@@ -1114,6 +1128,7 @@ class UserWindowController(BaseController):
         
         if not data.get('confirm_password') == data.get('password'):
             QMessageBox.critical(add_form, 'Error', 'Password do not match')
+            return
     
         resident_name = data.get("name")
         if not resident_name:  
@@ -1131,15 +1146,28 @@ class UserWindowController(BaseController):
         del data['name']
 
         del data['confirm_password']
-
-        salt = bcrypt.gensalt()
-        data['password'] = bcrypt.hashpw(data.get('password').encode('utf-8'), salt)
+        password = data.pop('password')
         
         # Uppercase all string values in data (excluding non-string types)
-        data = {key: value.upper() if isinstance(value, str) and key != 'username' and key != 'password' else value for key, value in data.items()}
+        data = {key: value.upper() if isinstance(value, str) and key != 'username' else value for key, value in data.items()}
+
+        # Hashed on the worker; the user is saved once the hash is ready
+        add_form.addbar.btAdd.setEnabled(False)
+        self.worker.submit(
+            'hash_password',
+            lambda session: auth.hash_password(password),
+            lambda hashed: self.save_new_user(add_form, data, resident, hashed),
+            lambda e: self.hash_failed(add_form, add_form.addbar.btAdd, e)
+        )
+
+    def save_new_user(self, add_form, data, resident, password):
+        add_form.addbar.btAdd.setEnabled(True)
+        if not add_form.isVisible():
+            # Cancelled while the password was hashed
+            return
     
         # Create a new Resident instance with the provided data
-        new_user = User(**data)
+        new_user = User(**data, password=password)
         new_user.resident = resident  # Associate the resident with the selected household
     
         try:
@@ -1157,6 +1185,7 @@ class UserWindowController(BaseController):
             add_form.activateWindow() 
             add_form.raise_()    
     
+    @unit_of_work
     def edit(self):
         try:
             row_id = self.view.get_table_row()
@@ -1259,11 +1288,25 @@ class UserWindowController(BaseController):
             QMessageBox.critical(update_form, "Error", "Selected resident does not exist.")
             return
     
+        # Hashed on the worker; the user is updated once the hash is ready
+        password = updated_data['password']
+        update_form.updatebar.btUpdate.setEnabled(False)
+        self.worker.submit(
+            'hash_password',
+            lambda session: auth.hash_password(password),
+            lambda hashed: self.apply_update(user, update_form, updated_data, resident, hashed),
+            lambda e: self.hash_failed(update_form, update_form.updatebar.btUpdate, e)
+        )
+
+    def apply_update(self, user, update_form, updated_data, resident, password):
+        update_form.updatebar.btUpdate.setEnabled(True)
+        if not update_form.isVisible():
+            # Cancelled while the password was hashed
+            return
+
         # Update resident fields
         user.username = updated_data['username']
-        salt = bcrypt.gensalt()
-        password_bytes = updated_data['password'].encode('utf-8')
-        user.password = bcrypt.hashpw(password_bytes, salt)
+        user.password = password
         user.position = updated_data['position']
         user.resident = resident
     
@@ -1275,7 +1318,12 @@ class UserWindowController(BaseController):
         except Exception as e:
             self.session.rollback()
             QMessageBox.critical(update_form, "Error", f"Failed to update User: {str(e)}")
+
+    def hash_failed(self, form, button, error):
+        button.setEnabled(True)
+        QMessageBox.critical(form, "Error", f"Could not hash the password: {str(error)}")
         
+    @unit_of_work
     def browse(self):
         try:
             row_id = self.view.get_table_row()
@@ -1304,6 +1352,7 @@ class UserWindowController(BaseController):
                 
                 browse_form.exec()
     
+    @unit_of_work
     def delete(self):
         try:
             row_id = self.view.get_table_row()
@@ -1326,6 +1375,7 @@ class UserWindowController(BaseController):
                     self.session.commit()
                     self.refresh()
 
+    @unit_of_work
     def filter_settings(self):
         filter_form = FilterUserForm()
         filter_form.filterbar.btCancel.clicked.connect(lambda: filter_form.reject)
@@ -1359,68 +1409,25 @@ class UserWindowController(BaseController):
         self.apply_filter(form)
 
 class BlotterWindowController(BaseController):
+    headers = ['id', 'Record Date', 'Complainant', 'Respondent', 'Status','Report']
+    rows = queries.BLOTTER_ROWS
+
     def __init__(self, view : BaseWindow):
         super().__init__(view)
     
     def default_filter(self):
         return self.session.query(Blotter).order_by(desc(Blotter.record_date))
             
+    @unit_of_work
     def refresh(self):
         self.view.set_search_text('')
-        blotters = self.current_filter.all()
-        data = []
-        for blotter in blotters:
-            result = [
-                blotter.id,
-                blotter.record_date,
-                blotter.complainant,
-                blotter.respondent,
-                blotter.status,
-                str(blotter.full_report)[:20]
-            ]
-            data.append(result)
-        self.view.lbTotal.setText(f"Total: {len(data)}")      
-        self.view.load_table(['id', 'Record Date', 'Complainant', 'Respondent', 'Status','Report'], data)
+        self.load_query(self.current_filter, show_total=True)
     
+    @unit_of_work
     def search(self):
-        search_text = self.view.get_search_text().lower()  
-        search_terms = search_text.split() 
-        
-        # Base query
-        query = self.current_filter
-        
-        # Apply AND of ORs: each term must match one of the fields
-        if search_terms:
-            conditions = []
-            for term in search_terms:
-                term_filter = or_(
-                    Blotter.record_date.ilike(f"%{term}%"),
-                    Blotter.complainant.ilike(f"%{term}%"),
-                    Blotter.respondent.ilike(f"%{term}%"),
-                    Blotter.status.ilike(f"%{term}%"),
-                    Blotter.full_report.ilike(f"%{term}%"),
-                )
-                conditions.append(term_filter)
-            
-            query = query.filter(and_(*conditions))
-        
-        # Order and execute
-        blotters = query.order_by(desc(Blotter.record_date)).all()
-        
-        data = []
-        for blotter in blotters:
-            result = [
-                blotter.id,
-                blotter.record_date,
-                blotter.complainant,
-                blotter.respondent,
-                blotter.status,
-                str(blotter.full_report)[:20]
-            ]
-            data.append(result)
-        
-        self.view.load_table(['id', 'Record Date', 'Complainant', 'Respondent', 'Status','Report'], data)
+        self.search_index(fts.BLOTTERS)
     
+    @unit_of_work
     def add(self):
             add_form = AddBlotterForm()
             add_form.addbar.btAdd.clicked.connect(lambda: self.on_add_button_click(add_form))
@@ -1462,6 +1469,7 @@ class BlotterWindowController(BaseController):
             self.session.rollback()
             QMessageBox.critical(add_form, "Error", f"Failed to add blotter: {str(e)}")
         
+    @unit_of_work
     def edit(self):
         try:
             row_id = self.view.get_table_row()
@@ -1542,6 +1550,7 @@ class BlotterWindowController(BaseController):
         
         update_form.accept()   
         
+    @unit_of_work
     def browse(self):
         try:
             row_id = self.view.get_table_row()
@@ -1567,6 +1576,7 @@ class BlotterWindowController(BaseController):
                 browse_form.exec()
         
     
+    @unit_of_work
     def delete(self):
         try:
             row_id = self.view.get_table_row()
@@ -1589,6 +1599,7 @@ class BlotterWindowController(BaseController):
                     self.session.commit()
                     self.refresh()
     
+    @unit_of_work
     def filter_settings(self):
         filter_form = FilterBlotterForm()
         filter_form.filterbar.btCancel.clicked.connect(lambda: filter_form.reject)
@@ -1638,95 +1649,30 @@ class BlotterWindowController(BaseController):
         self.apply_filter(form)
 
 class CertificateWindowController(BaseController):
-    def __init__(self, view : BaseWindow):
+    headers = ['id', 'Date Issued', 'Type', 'Resident', 'Purpose']
+    rows = queries.CERTIFICATE_ROWS
+
+    def __init__(self, view : CertificateWindow):
         super().__init__(view)
+        self.view.btPrintBatch.clicked.connect(self.print_batch)
     
     def default_filter(self):
-        return self.session.query(Certificate).outerjoin(Certificate.resident).order_by(desc(Certificate.date_issued))
+        return (
+            self.session.query(Certificate)
+            .outerjoin(Certificate.resident)
+            .order_by(desc(Certificate.date_issued))
+        )
     
+    @unit_of_work
     def refresh(self):
         self.view.set_search_text('')
-        certificates = self.current_filter.all()
-        data = []
-        for certificate in certificates:
-            resident = certificate.resident 
-            date_issued = certificate.date_issued
-            type = certificate.type
-            purpose = certificate.purpose
-            resident_name = [
-                getattr(resident, "first_name", ""),
-                getattr(resident, "middle_name", ""),
-                getattr(resident, "last_name", ""),
-                getattr(resident, "suffix", "")
-            ] if resident else []
-    
-            full_name = " ".join(filter(None, resident_name))
-    
-            result = [
-                certificate.id,
-                date_issued,
-                type,
-                full_name,
-                purpose
-            ]
-            data.append(result)
-        self.view.lbTotal.setText(f"Total: {len(data)}") 
-        self.view.load_table(['id', 'Date Issued', 'Type', 'Resident', 'Purpose'], data)
+        self.load_query(self.current_filter, show_total=True)
         
+    @unit_of_work
     def search(self):
-        search_text = self.view.get_search_text().lower()
-        search_terms = search_text.split()
-    
-        # Start with base query and join household
-        query = self.current_filter()
-    
-        # Apply search filters
-        if search_terms:
-            conditions = []
-            for term in search_terms:
-                term_filter = or_(
-                    Resident.first_name.ilike(f"%{term}%"),
-                    Resident.middle_name.ilike(f"%{term}%"),
-                    Resident.last_name.ilike(f"%{term}%"),
-                    Resident.suffix.ilike(f"%{term}%"),
-                    Certificate.date_issued.ilike(f"%{term}%"),
-                    Certificate.type.ilike(f"%{term}%"),
-                    Certificate.purpose.ilike(f"%{term}%")
-                )
-                conditions.append(term_filter)
-            
-            query = query.filter(and_(*conditions))
-    
-        # Apply sorting
-        certificates = query.order_by(desc(Certificate.date_issued), Resident.last_name).all()
-    
-        # Format results
-        data = []
-        for certificate in certificates:
-            resident = certificate.resident 
-            date_issued = certificate.date_issued
-            type = certificate.type
-            purpose = certificate.purpose
-            resident_name = [
-                getattr(resident, "first_name", ""),
-                getattr(resident, "middle_name", ""),
-                getattr(resident, "last_name", ""),
-                getattr(resident, "suffix", "")
-            ] if resident else []
+        self.search_index(fts.CERTIFICATES)
     
-            full_name = " ".join(filter(None, resident_name))
-    
-            result = [
-                certificate.id,
-                date_issued,
-                type,
-                full_name,
-                purpose
-            ]
-            data.append(result)
-        
-        self.view.load_table(['id', 'Date Issued', 'Type', 'Resident', 'Purpose'], data)
-        
+    @unit_of_work
     def add(self):
         add_form = AddCertificateForm()
         
@@ -1798,6 +1744,7 @@ class CertificateWindowController(BaseController):
             add_form.activateWindow() 
             add_form.raise_()    
     
+    @unit_of_work
     def edit(self):
         try:
             row_id = self.view.get_table_row()
@@ -1903,6 +1850,7 @@ class CertificateWindowController(BaseController):
             self.session.rollback()
             QMessageBox.critical(update_form, "Error", f"Failed to update Certificate: {str(e)}")
         
+    @unit_of_work
     def browse(self):
         try:
             row_id = self.view.get_table_row()
@@ -1934,136 +1882,129 @@ class CertificateWindowController(BaseController):
                 browse_form.exec()
     
     def export_certificate_to_docx(self, certificate, form):
-        resident = certificate.resident
-        full_name = " ".join(filter(None, [
-            resident.first_name,
-            resident.middle_name,
-            resident.last_name,
-            resident.suffix
-        ]))
+        full_name = documents.full_name(certificate.resident)
 
         save_path, _ = QFileDialog.getSaveFileName(
             form,
             "Save Certificate",
             f"{certificate.date_issued}_{full_name}_{certificate.type}.docx",
-            "Word Documents (*.docx)"
+            "Word Documents (*.docx);;PDF Files (*.pdf)"
         )
         if not save_path:
             return
 
+        if save_path.lower().endswith('.pdf'):
+            # Drawn directly; no DOCX template is involved
+            try:
+                pdf.render_certificate(certificate, save_path)
+                QMessageBox.information(form, "Success", "Certificate saved successfully.")
+            except Exception as e:
+                QMessageBox.critical(form, "Error", f"Could not save PDF certificate: {str(e)}")
+            return
+
         try:
-            if certificate.type == 'CLEARANCE':
-                template_path = "certificates/Barangay-Clearance-Template.docx"
-            elif certificate.type == 'INDIGENCY':
-                template_path = "certificates/Indigency-Template.docx"
-            elif certificate.type == 'RESIDENCY':
-                template_path = "certificates/Residency-Template.docx"
-            doc = Document(template_path)
+            template = documents.templates.get(documents.template_path(certificate.type))
         except Exception as e:
             QMessageBox.critical(form, "Error", f"Could not load DOCX template: {str(e)}")
             return
 
-        # Resident info
-        resident = certificate.resident
-        name = " ".join(filter(None, [
-            resident.first_name,
-            resident.middle_name,
-            resident.last_name,
-            resident.suffix
-        ]))
-        sex = resident.sex
-        age = self.calculate_age(resident.date_of_birth)
-        date_str = certificate.date_issued.strftime("%dth day of %B, %Y")
-        purpose = certificate.purpose
-        cert_type = certificate.type
-
-        if sex.upper() == "MALE":
-            pronouns = {
-                "{PRONOUN_SUBJ}": "he",
-                "{PRONOUN_OBJ}": "him",
-                "{PRONOUN_POS}": "his",
-                "{PRONOUN_POS_ADJ}": "his",  # possessive adjective
-                "{PRONOUN_REFLEX}": "himself"
-            }
-        elif sex.upper() == "FEMALE":
-            pronouns = {
-                "{PRONOUN_SUBJ}": "she",
-                "{PRONOUN_OBJ}": "her",
-                "{PRONOUN_POS}": "hers",
-                "{PRONOUN_POS_ADJ}": "her",  # possessive adjective
-                "{PRONOUN_REFLEX}": "herself"
-            }
-
-        # Replace placeholders
-        replacements = {
-            "{NAME}": name,
-            "{AGE}": str(age),
-            "{CIVIL}": resident.civil_status,
-            "{CITIZEN}": resident.citizenship,
-            "{DATE}": date_str,
-            "{PURPOSE}": purpose,
-            **pronouns
-        }
-
-        self.replace_placeholders_in_doc(doc, replacements)
-
         try:
-            doc.save(save_path)
+            template.render(documents.certificate_replacements(certificate), save_path)
             QMessageBox.information(form, "Success", "Certificate saved successfully.")
         except Exception as e:
-            QMessageBox.critical(form, "Error", f"Could not save DOCX file: {str(e)}")
-    
-    def calculate_age(self, date_of_birth: date) -> int:
-        today = date.today()
-        age = today.year - date_of_birth.year - (
-            (today.month, today.day) < (date_of_birth.month, date_of_birth.day)
+            QMessageBox.critical(form, "Error", f"Could not save certificate: {str(e)}")
+        
+    @unit_of_work
+    def print_batch(self):
+        batch_form = BatchCertificateForm()
+        batch_form.addbar.btAdd.clicked.connect(lambda: self.start_batch(batch_form))
+        batch_form.addbar.btCancel.clicked.connect(batch_form.reject)
+        batch_form.exec()
+
+    def start_batch(self, batch_form):
+        data = batch_form.get_fields()
+
+        if data['scope'] == 'SELECTED ROWS':
+            ids = self.view.get_selected_rows()
+            if not ids:
+                QMessageBox.warning(batch_form, 'Select Rows', 'Please Select Certificates to Print')
+                return
+            query = select(Certificate.id).where(Certificate.id.in_(ids))
+        elif data['scope'] == 'ISSUED TODAY':
+            query = select(Certificate.id).where(Certificate.date_issued == date.today())
+        else:
+            query = self.current_filter.with_entities(Certificate.id).order_by(None).statement
+
+        as_zip = data['output'] == 'ZIP FILE'
+        as_pdf = data['output'] == 'PDF FILE'
+        if as_pdf:
+            destination, _ = QFileDialog.getSaveFileName(
+                batch_form,
+                "Save Certificates",
+                f"certificates_{datetime.now():%Y_%m_%d}.pdf",
+                "PDF Files (*.pdf)"
+            )
+        elif as_zip:
+            destination, _ = QFileDialog.getSaveFileName(
+                batch_form,
+                "Save Certificates",
+                f"certificates_{datetime.now():%Y_%m_%d}.zip",
+                "Zip Files (*.zip)"
+            )
+        else:
+            destination = QFileDialog.getExistingDirectory(
+                batch_form,
+                "Select Folder to Save Certificates",
+                os.path.expanduser("~")
+            )
+        if not destination:
+            return
+
+        def job(session, report):
+            certificates = session.scalars(
+                select(Certificate)
+                .where(Certificate.id.in_(query.scalar_subquery()))
+                .options(joinedload(Certificate.resident))
+                .order_by(Certificate.id)
+            ).all()
+            jobs, failures = documents.batch_jobs(certificates)
+            if as_pdf:
+                result = pdf.render_batch(jobs, destination, report)
+            else:
+                result = documents.render_batch(jobs, destination, as_zip, report)
+            result.failures[:0] = failures
+            return result
+
+        batch_form.accept()
+        self.view.btPrintBatch.setEnabled(False)
+        self.view.pbPrintBatch.setValue(0)
+        self.view.pbPrintBatch.setVisible(True)
+        self.worker.submit('print', job, self.batch_finished, self.batch_failed, self.batch_progress)
+
+    def batch_progress(self, done, total):
+        self.view.pbPrintBatch.setMaximum(max(total, 1))
+        self.view.pbPrintBatch.setValue(done)
+
+    def batch_finished(self, result):
+        self.view.btPrintBatch.setEnabled(True)
+        self.view.pbPrintBatch.setVisible(False)
+        message = (
+            f"Printed {result.rendered} certificates to:\n{result.destination}\n\n"
+            f"{result.seconds:.1f} s, {result.rate():.1f} certificates per second."
         )
-        return age
-    
-    def replace_placeholders_in_doc(self, doc, replacements: dict):
-        def process_runs(runs):
-            # Combine all run texts into a single string
-            full_text = "".join(run.text for run in runs)
-            
-            # Replace placeholders in the combined text
-            for key, value in replacements.items():
-                if key in full_text:
-                    full_text = full_text.replace(key, value)
-                    
-                    # Update the first run with the new text and clear the rest
-                    runs[0].text = full_text
-                    for run in runs[1:]:
-                        run.text = ""
-
-        def process_paragraphs(paragraphs):
-            for paragraph in paragraphs:
-                process_runs(paragraph.runs)
-
-        def process_table(table):
-            for row in table.rows:
-                for cell in row.cells:
-                    process_paragraphs(cell.paragraphs)
-                    for nested_table in cell.tables:  # Handle nested tables
-                        process_table(nested_table)
-
-        def process_section(section):
-            # Process paragraphs in headers and footers
-            for header in [section.header, section.footer]:
-                process_paragraphs(header.paragraphs)
-                for table in header.tables:
-                    process_table(table)
-
-        # Process paragraphs in the main document body
-        process_paragraphs(doc.paragraphs)
-
-        # Process tables in the main document body
-        for table in doc.tables:
-            process_table(table)
-
-        # Process headers, footers, and other sections
-        for section in doc.sections:
-            process_section(section)
-        
+        if result.failures:
+            failed = "\n".join(f"Certificate {certificate_id}: {error}" for certificate_id, error in result.failures[:10])
+            more = f"\n... and {len(result.failures) - 10} more" if len(result.failures) > 10 else ""
+            QMessageBox.warning(self.view, "Print Finished", f"{message}\n\n{len(result.failures)} failed:\n{failed}{more}")
+        else:
+            QMessageBox.information(self.view, "Print Successful", message)
+
+    def batch_failed(self, error):
+        self.view.btPrintBatch.setEnabled(True)
+        self.view.pbPrintBatch.setVisible(False)
+        QMessageBox.critical(self.view, "Print Failed", str(error))
+
+    @unit_of_work
     def delete(self):
         try:
             row_id = self.view.get_table_row()
@@ -2086,6 +2027,7 @@ class CertificateWindowController(BaseController):
                     self.session.commit()
                     self.refresh()
 
+    @unit_of_work
     def filter_settings(self):
         filter_form = FilterCertificateForm()
         filter_form.filterbar.btCancel.clicked.connect(lambda: filter_form.reject)
@@ -2137,13 +2079,14 @@ class CertificateWindowController(BaseController):
 class AboutUsWindowController:
     def __init__(self, view: AboutWindow):
         self.db = Database()
-        self.session = self.db.get_session()
+        self.session = self.db.sessions
         self.view = view
         self.load_data()
 
+    @unit_of_work
     def load_data(self):
         barangay = self.session.query(Barangay).first()
-        users = self.session.query(User).join(User.resident).all()
+        users = self.session.query(User).join(User.resident).options(contains_eager(User.resident)).all()
 
         user_list = []
 
@@ -2183,15 +2126,50 @@ class SettingsWindowController:
         self.view = view
         self.parent = parent
         self.db = Database()
-        self.session = self.db.get_session()
+        self.session = self.db.sessions
+        self.worker = Worker(self.view)
         self.load_data()
 
         self.view.btSave.clicked.connect(self.save_changes)
         self.view.btRevert.clicked.connect(self.revert_changes)
         self.view.btExport.clicked.connect(self.export_csv)
+        self.view.btImport.clicked.connect(self.import_residents)
         self.view.btCreateBackup.clicked.connect(self.backup_database)
         self.view.btViewBackup.clicked.connect(self.switch_database)
-    
+        self.view.btRestoreSnapshot.clicked.connect(self.restore_snapshot)
+        self.view.btApplyProfile.clicked.connect(self.apply_profile)
+        self.view.cbExportFormat.addItems(list(export.EXPORT_FORMATS))
+        self.view.cbExportFormat.setCurrentText(settings.get('export/format', export.DEFAULT_FORMAT))
+        self.view.cbExportFormat.currentTextChanged.connect(lambda name: settings.put('export/format', name))
+        self.view.chkDeltaExport.setChecked(settings.get('export/delta', False, type=bool))
+        self.view.chkDeltaExport.toggled.connect(lambda checked: settings.put('export/delta', checked))
+        self.show_last_export()
+        self.view.cbCompression.addItems(list(backup.COMPRESSIONS))
+        self.view.cbCompression.setCurrentText('gzip')
+        self.view.sbBackupInterval.setValue(settings.get('backup/interval', DEFAULT_BACKUP_INTERVAL, type=int))
+        self.view.sbBackupInterval.valueChanged.connect(self.set_backup_interval)
+        self.view.cbProfile.currentTextChanged.connect(self.show_profile)
+        self.view.cbProfile.addItems(list(ENGINE_PROFILES))
+        self.view.cbProfile.setCurrentText(self.db.profile)
+    
+    def show_profile(self, profile):
+        pragmas = ENGINE_PROFILES.get(profile, {})
+        self.view.lbProfile.setText(
+            "\n".join(f"{name} = {value}" for name, value in pragmas.items())
+        )
+
+    def apply_profile(self):
+        profile = self.view.cbProfile.currentText()
+        try:
+            self.db.set_profile(profile)
+            QMessageBox.information(
+                self.view, "Success",
+                f"Database profile set to {profile}. A journal mode change applies the next time BRIMA starts."
+            )
+        except Exception as e:
+            QMessageBox.critical(self.view, "Error", f"Failed to apply profile: {str(e)}")
+
+    @unit_of_work
     def load_data(self):
         barangay = self.session.query(Barangay).first()
 
@@ -2203,6 +2181,7 @@ class SettingsWindowController:
                 vision = barangay.vision
             )
     
+    @unit_of_work
     def save_changes(self):
         data = self.view.get_fields()
         data = {key: value.upper() if isinstance(value, str) else value for key, value in data.items()}
@@ -2242,6 +2221,7 @@ class SettingsWindowController:
                 QMessageBox.critical(self.view, "Error", f"Failed to add resident: {str(e)}")
 
 
+    @unit_of_work
     def revert_changes(self):
         barangay = self.session.query(Barangay).first()
 
@@ -2253,152 +2233,152 @@ class SettingsWindowController:
                 vision = barangay.vision
             )
 
+    @unit_of_work
+    def show_last_export(self):
+        last = export.last_export(self.session)
+        if last is None:
+            self.view.lbLastExport.setText("Never")
+        else:
+            kind = "changes only" if last.delta else "all data"
+            self.view.lbLastExport.setText(f"{last.exported_at:%Y-%m-%d %H:%M} ({kind})")
+
     def export_csv(self):
         timestamp = datetime.now().strftime("%Y_%m_%d")
+        export_format = self.view.cbExportFormat.currentText()
+        delta = self.view.chkDeltaExport.isChecked()
+        extension, file_filter, _ = export.EXPORT_FORMATS[export_format]
+
+        file_path, _ = QFileDialog.getSaveFileName(
+            self.view,
+            f"Save {export_format} Export",
+            f"export_{timestamp}{extension}",
+            f"{file_filter};;All Files (*)"
+        )
 
-        try:
-            # Initialize a Pandas Excel writer to export multiple sheets
-            file_path, _ = QFileDialog.getSaveFileName(
-                self.view,
-                "Save Excel File",
-                f"export_{timestamp}.xlsx",
-                "Excel Files (*.xlsx);;All Files (*)"
-            )
+        if not file_path:
+            return  # User cancelled
+
+        # Rows are streamed to the file on a pool thread
+        self.view.btExport.setEnabled(False)
+        self.view.pbExport.setValue(0)
+        self.view.pbExport.setVisible(True)
+        self.worker.submit(
+            'export',
+            lambda session, report: export.run_export(session, export_format, file_path, delta, report),
+            self.export_finished,
+            self.export_failed,
+            self.export_progress
+        )
 
-            if not file_path:
-                return  # User cancelled
-
-            # Export Resident & Household data
-            stmt_resident_household = (
-                select(
-                    Resident.id.label("resident_id"),
-                    Resident.date_added,
-                    Resident.first_name,
-                    Resident.last_name,
-                    Resident.middle_name,
-                    Resident.suffix,
-                    Resident.date_of_birth,
-                    Resident.occupation,
-                    Resident.civil_status,
-                    Resident.citizenship,
-                    Resident.sex,
-                    Resident.education,
-                    Resident.remarks,
-                    Resident.phone1,
-                    Resident.phone2,
-                    Resident.email,
-                    Resident.role,
-                    Household.household_name,
-                    Household.house_no,
-                    Household.street,
-                    Household.sitio,
-                    Household.landmark
-                )
-                .join(Resident.household)
-            )
-            df_resident_household = pd.read_sql(stmt_resident_household, self.session.bind)
-            # Add age column
-            if not df_resident_household.empty and "date_of_birth" in df_resident_household.columns:
-                today = pd.Timestamp(datetime.today().date())
-                df_resident_household["age"] = (today - pd.to_datetime(df_resident_household["date_of_birth"])).dt.days // 365
-
-            # Export Resident & Certificate data
-            stmt_resident_certificate = (
-                select(
-                    Resident.id.label("resident_id"),
-                    Resident.first_name,
-                    Resident.middle_name,
-                    Resident.last_name,
-                    Resident.suffix,
-                    Certificate.type.label("certificate_type"),
-                    Certificate.purpose.label("certificate_purpose"),
-                    Certificate.date_issued
-                )
-                .join(Resident.certificates)
-            )
-            df_resident_certificate = pd.read_sql(stmt_resident_certificate, self.session.bind)
-
-            # Export Blotter data (full table)
-            stmt_blotter = select(Blotter)
-            df_blotter = pd.read_sql(stmt_blotter, self.session.bind)
-
-            # Export Resident & User data
-            stmt_resident_user = (
-                select(
-                    Resident.id.label("resident_id"),
-                    Resident.first_name,
-                    Resident.last_name,
-                    Resident.middle_name,
-                    Resident.suffix,
-                    Resident.date_of_birth,
-                    Resident.occupation,
-                    Resident.civil_status,
-                    Resident.citizenship,
-                    Resident.sex,
-                    Resident.education,
-                    Resident.remarks,
-                    Resident.phone1,
-                    Resident.phone2,
-                    Resident.email,
-                    Resident.role,
-                    Household.household_name,
-                    Household.house_no,
-                    Household.street,
-                    Household.sitio,
-                    Household.landmark,
-                    User.username,
-                    User.position
-                )
-                .join(Resident.user)  
-                .join(Resident.household)  
-            )
-            df_resident_user = pd.read_sql(stmt_resident_user, self.session.bind)
-            # Add age column
-            if not df_resident_user.empty and "date_of_birth" in df_resident_user.columns:
-                today = pd.Timestamp(datetime.today().date())
-                df_resident_user["age"] = (today - pd.to_datetime(df_resident_user["date_of_birth"])).dt.days // 365
+    def export_progress(self, stage, done, total):
+        self.view.pbExport.setFormat(f"{stage} %p%")
+        self.view.pbExport.setMaximum(max(total, 1))
+        self.view.pbExport.setValue(done)
+
+    def export_finished(self, paths):
+        self.view.btExport.setEnabled(True)
+        self.view.pbExport.setVisible(False)
+        self.show_last_export()
+        QMessageBox.information(self.view, "Export Successful", "Data saved to:\n" + "\n".join(paths))
+
+    def export_failed(self, error):
+        self.view.btExport.setEnabled(True)
+        self.view.pbExport.setVisible(False)
+        QMessageBox.critical(self.view, "Export Failed", str(error))
+
+    def import_residents(self):
+        file_path, _ = QFileDialog.getOpenFileName(
+            self.view,
+            "Import Residents",
+            os.path.expanduser("~"),
+            "RBI Sheets (*.xlsx *.csv);;All Files (*)"
+        )
 
-            with pd.ExcelWriter(file_path, engine='openpyxl') as writer:
-                df_resident_household.to_excel(writer, sheet_name="RBI", index=False)
-                df_resident_certificate.to_excel(writer, sheet_name="Certificates", index=False)
-                df_blotter.to_excel(writer, sheet_name="Blotters", index=False)
-                df_resident_user.to_excel(writer, sheet_name="Officials", index=False)
+        if not file_path:
+            return  # User cancelled
+
+        self.view.btImport.setEnabled(False)
+        self.view.pbImport.setValue(0)
+        self.view.pbImport.setVisible(True)
+        self.worker.submit(
+            'import',
+            lambda session, report: importer.import_residents(session, file_path, report),
+            self.import_finished,
+            self.import_failed,
+            self.import_progress
+        )
 
-            QMessageBox.information(self.view, "Export Successful", f"Data saved to:\n{file_path}")
+    def import_progress(self, done, total):
+        self.view.pbImport.setMaximum(max(total, 1))
+        self.view.pbImport.setValue(done)
+
+    def import_finished(self, result):
+        self.view.btImport.setEnabled(True)
+        self.view.pbImport.setVisible(False)
+        message = f"Imported {result.residents} residents and {result.households} new households."
+        if result.rejected:
+            message += f"\n\n{len(result.rejected)} rows were rejected. The rows and the reasons are listed in:\n{result.rejected_path}"
+            QMessageBox.warning(self.view, "Import Finished", message)
+        else:
+            QMessageBox.information(self.view, "Import Successful", message)
 
-        except Exception as e:
-            # Handle any errors
-            QMessageBox.critical(self.view, "Export Failed", str(e))
+    def import_failed(self, error):
+        self.view.btImport.setEnabled(True)
+        self.view.pbImport.setVisible(False)
+        QMessageBox.critical(self.view, "Import Failed", str(error))
 
     def backup_database(self):
-        try:
-            # Ask the user to select a folder to save the backup
-            folder_path = QFileDialog.getExistingDirectory(
-                self.view,
-                "Select Folder to Save Backup",
-                os.path.expanduser("~")  # Default to user's home directory
-            )
-
-            if not folder_path:
-                return  # User cancelled
+        # Ask the user to select a folder to save the backup
+        folder_path = QFileDialog.getExistingDirectory(
+            self.view,
+            "Select Folder to Save Backup",
+            os.path.expanduser("~")  # Default to user's home directory
+        )
 
-            # Get the current timestamp to append to the backup file name
-            timestamp = datetime.now().strftime("%Y_%m_%d_%H_%M_%S")
-            backup_filename = f"database_backup_{timestamp}.sqlite"
+        if not folder_path:
+            return  # User cancelled
+
+        # Get the current timestamp to append to the backup file name
+        timestamp = datetime.now().strftime("%Y_%m_%d_%H_%M_%S")
+        name = f"database_backup_{timestamp}"
+
+        source_db_path = self.db.engine.url.database
+        compact = self.view.chkCompact.isChecked()
+        compression = self.view.cbCompression.currentText()
+
+        # Snapshot the live database in the background, a few pages at a time
+        self.view.btCreateBackup.setEnabled(False)
+        self.view.pbBackup.setValue(0)
+        self.view.pbBackup.setVisible(True)
+        self.worker.submit(
+            'backup',
+            lambda session, report: backup.backup_database(
+                source_db_path, folder_path, name, compact, compression, report
+            ),
+            self.backup_finished,
+            self.backup_failed,
+            self.backup_progress
+        )
 
-            # Specify the source (current database file) and the destination (selected folder)
-            source_db_path = "main.sqlite"  # Adjust with the actual path
-            destination_db_path = os.path.join(folder_path, backup_filename)
+    def set_backup_interval(self, minutes):
+        settings.put('backup/interval', minutes)
+        self.parent.schedule_backups()
 
-            # Copy the database to the selected folder
-            shutil.copy(source_db_path, destination_db_path)
+    def backup_progress(self, stage, done, total):
+        self.view.pbBackup.setFormat(f"{stage} %p%")
+        self.view.pbBackup.setMaximum(max(total, 1))
+        self.view.pbBackup.setValue(done)
 
-            # Show a message confirming the backup was successful
-            QMessageBox.information(self.view, "Backup Successful", f"Database backed up to:\n{destination_db_path}")
+    def backup_finished(self, destination_db_path):
+        self.view.btCreateBackup.setEnabled(True)
+        self.view.pbBackup.setVisible(False)
+        # Show a message confirming the backup was successful
+        QMessageBox.information(self.view, "Backup Successful", f"Database backed up to:\n{destination_db_path}")
 
-        except Exception as e:
-            # Handle any errors
-            QMessageBox.critical(self.view, "Backup Failed", str(e))
+    def backup_failed(self, error):
+        self.view.btCreateBackup.setEnabled(True)
+        self.view.pbBackup.setVisible(False)
+        QMessageBox.critical(self.view, "Backup Failed", str(error))
 
     def switch_database(self):
         try:
@@ -2421,7 +2401,7 @@ class SettingsWindowController:
                 self.view,
                 "Select SQLite Database to Replace Current DB",
                 "",
-                "SQLite Files (*.sqlite *.db *.SQLITE *.DB);;All Files (*)"
+                "SQLite Files (*.sqlite *.db *.SQLITE *.DB *.gz *.zst);;All Files (*)"
 
             )
 
@@ -2440,14 +2420,9 @@ class SettingsWindowController:
             if confirm == QMessageBox.No:
                 return  # If the user selects 'No', do nothing
 
-            # Copy the selected new database to overwrite the current main.sqlite
-            shutil.copy(db_path, 'main.sqlite')
-
-            # Reinitialize the Database singleton to use the new database
-            db_instance = Database(db_url='sqlite:///main.sqlite')  # Reuse the default database path
-            db_instance.engine.dispose()  # Dispose of the old engine connection
-            db_instance.engine = create_engine(f"sqlite:///{db_path}")  # Set the new database
-            db_instance.Session = sessionmaker(bind=db_instance.engine)  # Rebind the session to the new engine
+            # Let background jobs finish, then swap the file under the engine
+            QThreadPool.globalInstance().waitForDone()
+            self.db.switch_to(db_path)
 
             # Notify the user
             QMessageBox.information(None, "Database Switched", "The database has been replaced successfully. Please Login Again.")
@@ -2457,6 +2432,67 @@ class SettingsWindowController:
             # Handle any errors
             QMessageBox.critical(None, "Error", f"Failed to switch databases: {str(e)}")
 
+    def restore_snapshot(self):
+        store_path = os.path.join(self.parent.snapshot_folder(), backup.STORE_NAME)
+        snapshots = backup.list_snapshots(store_path) if os.path.exists(store_path) else []
+        if not snapshots:
+            QMessageBox.information(
+                self.view, "No Automatic Backups",
+                f"No automatic backups were found in:\n{os.path.dirname(store_path)}"
+            )
+            return
+
+        labels = [
+            f"{taken_at:%Y-%m-%d %H:%M:%S}  ({size / (1024 * 1024):.1f} MB)"
+            for _, taken_at, size in snapshots
+        ]
+        label, ok = QInputDialog.getItem(
+            self.view, "Restore Automatic Backup", "Backup to restore:", labels, 0, False
+        )
+        if not ok:
+            return
+        snapshot_id = snapshots[labels.index(label)][0]
+
+        reply = QMessageBox.warning(
+            self.view,
+            "Extreme Caution!",
+            f"This will overwrite the current database with the automatic backup from {label}. Are you sure?",
+            QMessageBox.Yes | QMessageBox.No,
+            QMessageBox.No
+        )
+        if reply == QMessageBox.No:
+            return
+
+        # Rebuilt from its chunks in the background, then switched to here
+        restored_path = self.db.engine.url.database + '.restore'
+        self.view.btRestoreSnapshot.setEnabled(False)
+        self.worker.submit(
+            'restore',
+            lambda session: backup.restore_snapshot(store_path, snapshot_id, restored_path),
+            lambda _: self.restore_finished(restored_path),
+            self.restore_failed
+        )
+
+    def restore_finished(self, restored_path):
+        self.view.btRestoreSnapshot.setEnabled(True)
+        try:
+            # Let background jobs finish, then swap the file under the engine
+            QThreadPool.globalInstance().waitForDone()
+            self.db.switch_to(restored_path)
+        except Exception as e:
+            QMessageBox.critical(self.view, "Restore Failed", str(e))
+            return
+        finally:
+            if os.path.exists(restored_path):
+                os.remove(restored_path)
+
+        QMessageBox.information(None, "Database Restored", "The automatic backup has been restored successfully. Please Login Again.")
+        self.parent.force_logout()
+
+    def restore_failed(self, error):
+        self.view.btRestoreSnapshot.setEnabled(True)
+        QMessageBox.critical(self.view, "Restore Failed", str(error))
+
 
 COLOR_PALETTE = [
     QColor(70, 130, 180),   # Steel blue
@@ -2471,7 +2507,7 @@ class DashboardWindowController:
     def __init__(self, view: DashboardWindow):
         self.view = view
         self.db = Database()
-        self.session = self.db.get_session()
+        self.worker = Worker(self.view)
         self.load_data()
 
     def update_bar_plot(self, plot, categories, values, title="Chart"):
@@ -2524,73 +2560,33 @@ class DashboardWindowController:
             plot.addItem(label)
             
     def load_data(self):
-        # Count of entities
-        households = self.session.query(Household).all()
-        residents = self.session.query(Resident).all()
-        blotters = self.session.query(Blotter).all()
-        certificates = self.session.query(Certificate).all()
+        # Totals come from the stats cache; stale charts are recomputed off the UI thread
+        self.worker.submit(
+            'dashboard', stats.cache.load, self.show_data,
+            lambda e: QMessageBox.critical(self.view, "Error", f"Failed to load dashboard: {str(e)}")
+        )
 
+    def show_data(self, charts):
+        counts = charts.get(stats.ENTITIES, {})
         self.update_bar_plot(
             self.view.plot_items[0],
             categories=['Households', 'Residents', 'Blotters', 'Certificates'],
-            values=[len(households), len(residents), len(blotters), len(certificates)],
+            values=[counts.get(name, 0) for name in queries.DASHBOARD_ENTITIES],
             title="Total Number of Entities Recorded"
         )
 
-        # Sitio Count aggregate (Residents)
-        stmt_sitio = select(Household.sitio).join(Resident.household)
-        df = pd.read_sql(stmt_sitio, self.session.bind)
-        sitio_counts = df["sitio"].value_counts().sort_index()
-        categories = sitio_counts.index.tolist()
-        values = sitio_counts.values.tolist()
-
-        self.update_bar_plot(self.view.plot_items[1], categories, values, "Resident Sitio Distribution")
-
-        # Age groups
-        stmt_age = select(Resident.date_of_birth)
-        df = pd.read_sql(stmt_age, self.session.bind)
-        df["date_of_birth"] = pd.to_datetime(df["date_of_birth"])
-        today = pd.Timestamp(datetime.today().date())
-        df["age"] = (today - df["date_of_birth"]).dt.days // 365
-
-        bins = [-float('inf'), 17, 30, 59, float('inf')]
-        labels = ["0-17", "18-30", "31-59", "60+"]
-        df["age_range"] = pd.cut(df["age"], bins=bins, labels=labels, right=False)
-
-        age_counts = df["age_range"].value_counts().sort_index()
-        categories = age_counts.index.tolist()
-        values = age_counts.values.tolist()
-
-        self.update_bar_plot(self.view.plot_items[2], categories, values, "Resident Age Group Distribution")
-
-        # Sex
-        stmt_sex = select(Resident.sex)
-        df = pd.read_sql(stmt_sex, self.session.bind)
-
-        sex_counts = df["sex"].value_counts().sort_index()
-        categories = sex_counts.index.tolist()
-        values = sex_counts.values.tolist()
-
-        self.update_bar_plot(self.view.plot_items[3], categories, values, "Resident Gender/Sex Distribution")
-
-        # Civil Status
-        stmt_civil = select(Resident.civil_status)
-        df = pd.read_sql(stmt_civil, self.session.bind)
-
-        civil_counts = df["civil_status"].value_counts().sort_index()
-        categories = civil_counts.index.tolist()
-        values = civil_counts.values.tolist()
-
-        self.update_bar_plot(self.view.plot_items[4], categories, values, "Resident Civil Status Distribution")
-
-        # Blotter Status
-        stmt_status = select(Blotter.status)
-        df = pd.read_sql(stmt_status, self.session.bind)
-
-        status_counts = df["status"].value_counts().sort_index()
-        categories = status_counts.index.tolist()
-        values = status_counts.values.tolist()
-
-        self.update_bar_plot(self.view.plot_items[5], categories, values, "Blotter Status Distribution")
-
-
+        for plot, chart, title in [
+            (1, 'sitio', "Resident Sitio Distribution"),
+            (2, 'age', "Resident Age Group Distribution"),
+            (3, 'sex', "Resident Gender/Sex Distribution"),
+            (4, 'civil_status', "Resident Civil Status Distribution"),
+            (5, 'blotter_status', "Blotter Status Distribution"),
+        ]:
+            counts = charts.get(chart, {})
+            if chart == 'age':
+                # Age groups are always shown, even when empty
+                categories = queries.AGE_GROUPS
+            else:
+                categories = sorted(counts)
+            values = [counts.get(category, 0) for category in categories]
+            self.update_bar_plot(self.view.plot_items[plot], list(categories), values, title)
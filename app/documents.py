@@ -0,0 +1,356 @@
+import io
+import multiprocessing
+import os
+import re
+import threading
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date
+from xml.sax.saxutils import escape
+from docx import Document
+
+# Certificate templates. Each DOCX template in certificates/ is parsed
+# once and compiled: every {PLACEHOLDER} is located down to the runs that
+# hold it, including placeholders Word split across several runs.
+# Compiled templates are cached until the file's mtime changes.
+#
+# Certificates are rendered without python-docx: at compile time every
+# placeholder run gets a numbered slot marker and the package is saved
+# once, which leaves each part exactly as python-docx would write it. The
+# parts with slots are split into byte chunks around them, so a render is
+# a single pass that joins the chunks with the run XML of each value and
+# writes the other parts through unchanged. The output has the same part
+# contents as patching the runs through python-docx.
+
+TEMPLATE_FOLDER = "certificates"
+
+TEMPLATES = {
+    'CLEARANCE': "Barangay-Clearance-Template.docx",
+    'INDIGENCY': "Indigency-Template.docx",
+    'RESIDENCY': "Residency-Template.docx",
+}
+
+PLACEHOLDER = re.compile(r'\{[A-Z_]+\}')
+SLOT = re.compile(rb'<w:t>BRIMASLOT(\d+)X</w:t>')
+# Fast deflate for rendered certificates: a little larger than Word's
+# own files, but compressing the big styles part dominated the render
+DOCX_COMPRESSLEVEL = 1
+
+PRONOUNS = {
+    "MALE": {
+        "{PRONOUN_SUBJ}": "he",
+        "{PRONOUN_OBJ}": "him",
+        "{PRONOUN_POS}": "his",
+        "{PRONOUN_POS_ADJ}": "his",  # possessive adjective
+        "{PRONOUN_REFLEX}": "himself"
+    },
+    "FEMALE": {
+        "{PRONOUN_SUBJ}": "she",
+        "{PRONOUN_OBJ}": "her",
+        "{PRONOUN_POS}": "hers",
+        "{PRONOUN_POS_ADJ}": "her",  # possessive adjective
+        "{PRONOUN_REFLEX}": "herself"
+    },
+}
+
+
+def template_path(certificate_type) -> str:
+    if certificate_type not in TEMPLATES:
+        raise ValueError(f"No template for {certificate_type} certificates")
+    return os.path.join(TEMPLATE_FOLDER, TEMPLATES[certificate_type])
+
+
+def all_paragraphs(doc):
+    # Body, tables (nested too), headers and footers, each paragraph once
+    def table_paragraphs(table):
+        for row in table.rows:
+            for cell in row.cells:
+                yield from cell.paragraphs
+                for nested_table in cell.tables:
+                    yield from table_paragraphs(nested_table)
+
+    def story_paragraphs(story):
+        yield from story.paragraphs
+        for table in story.tables:
+            yield from table_paragraphs(table)
+
+    seen = set()
+    stories = [doc] + [part for section in doc.sections for part in (section.header, section.footer)]
+    for story in stories:
+        for paragraph in story_paragraphs(story):
+            # Merged cells and linked headers return the same paragraph again
+            if paragraph._p not in seen:
+                seen.add(paragraph._p)
+                yield paragraph
+
+
+def compile_runs(runs):
+    # [(run, pieces)] for the runs a placeholder touches; pieces are the
+    # run's text split into literal strings and placeholder keys, with a
+    # split placeholder's key in its first run and nothing in the others
+    texts = [run.text for run in runs]
+    full_text = "".join(texts)
+    matches = list(PLACEHOLDER.finditer(full_text))
+    if not matches:
+        return []
+
+    compiled = []
+    start = 0
+    for run, text in zip(runs, texts):
+        end = start + len(text)
+        pieces = []
+        touched = False
+        position = start
+        for match in matches:
+            if match.end() <= start or match.start() >= end:
+                continue
+            touched = True
+            if match.start() > position:
+                pieces.append(full_text[position:match.start()])
+            if match.start() >= start:
+                pieces.append((match.group(),))
+            position = min(match.end(), end)
+        if touched:
+            if position < end:
+                pieces.append(full_text[position:end])
+            compiled.append((run, pieces))
+        start = end
+    return compiled
+
+
+def run_xml(text) -> bytes:
+    # The content python-docx writes for run.text = text
+    parts = []
+    for segment in re.split(r'(\t|\r|\n)', text):
+        if segment == '\t':
+            parts.append('<w:tab/>')
+        elif segment in ('\r', '\n'):
+            parts.append('<w:br/>')
+        elif segment:
+            space = ' xml:space="preserve"' if len(segment.strip()) < len(segment) else ''
+            parts.append(f'<w:t{space}>{escape(segment)}</w:t>')
+    return ''.join(parts).encode('utf-8')
+
+
+class CompiledTemplate:
+    def __init__(self, path):
+        self.path = path
+        self.doc = Document(path)
+        self.runs = [
+            (run, run.text, pieces)
+            for paragraph in all_paragraphs(self.doc)
+            for run, pieces in compile_runs(paragraph.runs)
+        ]
+        self.placeholders = {
+            piece[0] for _, _, pieces in self.runs for piece in pieces if isinstance(piece, tuple)
+        }
+        # The document is patched in place, one render at a time
+        self.lock = threading.Lock()
+        self.entries = self.compile_parts()
+
+    def run_texts(self, replacements: dict):
+        # Unknown placeholders are left in the document as they are
+        for _, _, pieces in self.runs:
+            yield "".join(
+                (replacements.get(piece[0], piece[0]) or "") if isinstance(piece, tuple) else piece
+                for piece in pieces
+            )
+
+    def patched(self, texts, save_path):
+        with self.lock:
+            try:
+                for (run, _, _), text in zip(self.runs, texts):
+                    run.text = text
+                self.doc.save(save_path)
+            finally:
+                for run, text, _ in self.runs:
+                    run.text = text
+
+    def compile_parts(self):
+        # [(part name, compression, chunks)]; chunks alternate literal bytes
+        # and slot numbers
+        buffer = io.BytesIO()
+        self.patched((f"BRIMASLOT{number}X" for number in range(len(self.runs))), buffer)
+        entries = []
+        with zipfile.ZipFile(buffer) as package:
+            for info in package.infolist():
+                data = package.read(info)
+                chunks = SLOT.split(data)
+                chunks[1::2] = [int(number) for number in chunks[1::2]]
+                # Images are compressed already; deflating them again on
+                # every render costs most of the time and saves nothing
+                compression = zipfile.ZIP_DEFLATED
+                if info.compress_size >= 0.95 * info.file_size:
+                    compression = zipfile.ZIP_STORED
+                entries.append((info.filename, compression, chunks))
+        return entries
+
+    def render(self, replacements: dict, save_path):
+        # save_path may also be a file object
+        values = [run_xml(text) for text in self.run_texts(replacements)]
+        with zipfile.ZipFile(save_path, 'w') as package:
+            for name, compression, chunks in self.entries:
+                if len(chunks) > 1:
+                    chunks = [values[chunk] if isinstance(chunk, int) else chunk for chunk in chunks]
+                package.writestr(name, b"".join(chunks), compress_type=compression, compresslevel=DOCX_COMPRESSLEVEL)
+
+
+class TemplateCache:
+    def __init__(self):
+        self.templates = {}
+        self.lock = threading.Lock()
+
+    def get(self, path) -> CompiledTemplate:
+        mtime = os.stat(path).st_mtime_ns
+        with self.lock:
+            cached = self.templates.get(path)
+            if cached is not None and cached[0] == mtime:
+                return cached[1]
+        template = CompiledTemplate(path)
+        with self.lock:
+            self.templates[path] = (mtime, template)
+        return template
+
+
+templates = TemplateCache()
+
+
+def calculate_age(date_of_birth: date, today: date = None) -> int:
+    today = today or date.today()
+    age = today.year - date_of_birth.year - (
+        (today.month, today.day) < (date_of_birth.month, date_of_birth.day)
+    )
+    return age
+
+def full_name(resident) -> str:
+    return " ".join(filter(None, [
+        resident.first_name,
+        resident.middle_name,
+        resident.last_name,
+        resident.suffix
+    ]))
+
+def certificate_replacements(certificate) -> dict:
+    resident = certificate.resident
+    return {
+        "{NAME}": full_name(resident),
+        "{AGE}": str(calculate_age(resident.date_of_birth)),
+        "{CIVIL}": resident.civil_status,
+        "{CITIZEN}": resident.citizenship,
+        "{DATE}": certificate.date_issued.strftime("%dth day of %B, %Y"),
+        "{PURPOSE}": certificate.purpose,
+        **PRONOUNS.get((resident.sex or "").upper(), {})
+    }
+
+
+# Batch printing. Certificates are turned into plain (id, type,
+# replacements, file name) jobs on the calling thread, then rendered by a
+# process pool: python-docx holds the GIL while it builds and serializes
+# XML, so threads would not run in parallel. Each process compiles a
+# template the first time it needs it and reuses it for the rest of the
+# batch. Small batches are rendered in-process, where starting the pool
+# would cost more than it saves.
+
+BATCH_MIN_FOR_POOL = 8
+
+
+class BatchResult:
+    def __init__(self):
+        self.rendered = 0
+        self.failures = []  # (certificate id, error message)
+        self.seconds = 0.0
+        self.destination = None
+
+    def rate(self) -> float:
+        return self.rendered / self.seconds if self.seconds else 0.0
+
+
+def certificate_file_name(certificate) -> str:
+    name = f"{certificate.id}_{certificate.date_issued}_{full_name(certificate.resident)}_{certificate.type}.docx"
+    return re.sub(r'[\\/:*?"<>|]+', '_', name)
+
+def batch_jobs(certificates):
+    # (jobs, failures) for Certificate rows with their residents loaded
+    jobs, failures = [], []
+    for certificate in certificates:
+        try:
+            jobs.append((
+                certificate.id,
+                certificate.type,
+                certificate_replacements(certificate),
+                certificate_file_name(certificate),
+            ))
+        except Exception as e:
+            failures.append((certificate.id, str(e)))
+    return jobs, failures
+
+
+def render_job(job, folder=None):
+    # Runs in a pool process; returns the DOCX bytes when folder is None
+    _, certificate_type, replacements, file_name = job
+    template = templates.get(template_path(certificate_type))
+    if folder is None:
+        buffer = io.BytesIO()
+        template.render(replacements, buffer)
+        return buffer.getvalue()
+    template.render(replacements, os.path.join(folder, file_name))
+
+def render_jobs_in_pool(jobs, folder):
+    # Yields (job, result, error) as each job finishes
+    workers = min(os.cpu_count() or 1, len(jobs))
+    # spawn: a forked copy of the app's Qt and SQLite threads is not safe
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        futures = {pool.submit(render_job, job, folder): job for job in jobs}
+        for future in as_completed(futures):
+            try:
+                yield futures[future], future.result(), None
+            except Exception as e:
+                yield futures[future], None, e
+
+def render_jobs_here(jobs, folder):
+    for job in jobs:
+        try:
+            yield job, render_job(job, folder), None
+        except Exception as e:
+            yield job, None, e
+
+
+def render_batch(jobs, destination, as_zip=False, progress=None) -> BatchResult:
+    # destination is a folder, or the path of the zip file to write;
+    # progress receives (certificates done, total)
+    result = BatchResult()
+    result.destination = destination
+    started = time.perf_counter()
+    render = render_jobs_in_pool if len(jobs) >= BATCH_MIN_FOR_POOL else render_jobs_here
+
+    def collect(archive=None):
+        done = 0
+        for job, data, error in render(jobs, None if as_zip else destination):
+            if error is not None:
+                result.failures.append((job[0], str(error)))
+            else:
+                if archive is not None:
+                    # DOCX files are zip archives already
+                    archive.writestr(job[3], data, compress_type=zipfile.ZIP_STORED)
+                result.rendered += 1
+            done += 1
+            if progress:
+                progress(done, len(jobs))
+
+    if as_zip:
+        part = destination + '.part'
+        try:
+            with zipfile.ZipFile(part, 'w') as archive:
+                collect(archive)
+            os.replace(part, destination)
+        finally:
+            if os.path.exists(part):
+                os.remove(part)
+    else:
+        os.makedirs(destination, exist_ok=True)
+        collect()
+
+    result.seconds = time.perf_counter() - started
+    return result
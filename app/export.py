@@ -0,0 +1,237 @@
+import csv
+import json
+import os
+import pickle
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from sqlalchemy import select, delete, func
+from openpyxl import Workbook
+from base import Database
+from model import ChangeLog, DataExport
+import queries
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# Streaming data export. Rows are paged out of SQLite with yield_per and
+# handed to the writer of the chosen format one batch at a time, so
+# memory stays bounded however large the database is. Every format shares
+# the sheet statements in queries.EXPORT_SHEETS; XLSX puts the sheets in
+# one workbook, the other formats write one file per sheet.
+#
+# Sheets are exported in parallel, each on its own thread with its own
+# session and so its own read connection; WAL lets them all read while
+# the app keeps writing. A format that writes one file per sheet does
+# the whole sheet on its thread. A workbook can only be written by one
+# thread, so for XLSX the threads spool their rows to temporary files and
+# the workbook is assembled from those once every query has finished.
+#
+# A delta export holds only the rows changed since the previous export,
+# found through the change_log watermark each export records (see
+# changelog.py), and a sheet of deleted rows. Log entries up to the
+# watermark are dropped once an export has finished.
+
+EXPORT_BATCH = 1000
+EXPORT_THREADS = 4
+
+
+def count_rows(session, stmt) -> int:
+    return session.execute(select(func.count()).select_from(stmt.order_by(None).subquery())).scalar()
+
+
+def batches(session, stmt):
+    # (column names, iterator over lists of row tuples)
+    result = session.execute(stmt.execution_options(yield_per=EXPORT_BATCH))
+    return list(result.keys()), result.partitions()
+
+
+def finish_file(path, write):
+    # Only a complete file ever carries the chosen name
+    part = path + '.part'
+    try:
+        write(part)
+        os.replace(part, path)
+    finally:
+        if os.path.exists(part):
+            os.remove(part)
+
+
+def in_parallel(sheets, export_sheet) -> list:
+    # export_sheet(session, name, stmt) for every sheet, each on its own
+    # thread and session; returns the results in sheet order
+    def run(name, stmt):
+        with Database().unit_of_work() as session:
+            return export_sheet(session, name, stmt)
+
+    with ThreadPoolExecutor(max_workers=EXPORT_THREADS) as pool:
+        futures = [pool.submit(run, name, stmt) for name, stmt in sheets]
+        return [future.result() for future in futures]
+
+
+def spool(session, stmt, rows_read):
+    # (column names, temporary file of pickled row batches)
+    columns, parts = batches(session, stmt)
+    spooled = tempfile.TemporaryFile()
+    try:
+        for rows in parts:
+            pickle.dump([tuple(row) for row in rows], spooled)
+            rows_read(len(rows))
+    except BaseException:
+        spooled.close()
+        raise
+    spooled.seek(0)
+    return columns, spooled
+
+def spooled_batches(spooled):
+    while True:
+        try:
+            yield pickle.load(spooled)
+        except EOFError:
+            return
+
+def write_xlsx_sheets(sheets, file_path, progress):
+    rows_read = progress('Reading')
+    spools = in_parallel(sheets, lambda session, name, stmt: spool(session, stmt, rows_read))
+    try:
+        rows_written = progress('Writing')
+        workbook = Workbook(write_only=True)
+        for (name, _), (columns, spooled) in zip(sheets, spools):
+            worksheet = workbook.create_sheet(name)
+            worksheet.append(columns)
+            for rows in spooled_batches(spooled):
+                for row in rows:
+                    worksheet.append(list(row))
+                rows_written(len(rows))
+        finish_file(file_path, workbook.save)
+    finally:
+        for _, spooled in spools:
+            spooled.close()
+    return [file_path]
+
+
+def write_csv(session, stmt, path, rows_written):
+    columns, parts = batches(session, stmt)
+    def write(part):
+        # utf-8-sig so Excel detects the encoding of names with accents
+        with open(part, 'w', newline='', encoding='utf-8-sig') as f:
+            writer = csv.writer(f)
+            writer.writerow(columns)
+            for rows in parts:
+                writer.writerows(rows)
+                rows_written(len(rows))
+    finish_file(path, write)
+
+
+def json_value(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+def write_jsonl(session, stmt, path, rows_written):
+    columns, parts = batches(session, stmt)
+    def write(part):
+        with open(part, 'w', encoding='utf-8') as f:
+            for rows in parts:
+                for row in rows:
+                    f.write(json.dumps(dict(zip(columns, row)), default=json_value, ensure_ascii=False))
+                    f.write('\n')
+                rows_written(len(rows))
+    finish_file(path, write)
+
+
+def arrow_type(column):
+    # The Parquet schema comes from the statement, not from the data, so a
+    # batch where a column happens to be all NULL still matches the others
+    try:
+        python_type = column.type.python_type
+    except NotImplementedError:
+        return pyarrow.string()
+    return {
+        bool: pyarrow.bool_(),
+        int: pyarrow.int64(),
+        float: pyarrow.float64(),
+        date: pyarrow.date32(),
+        datetime: pyarrow.timestamp('us'),
+    }.get(python_type, pyarrow.string())
+
+def write_parquet(session, stmt, path, rows_written):
+    schema = pyarrow.schema([(column.name, arrow_type(column)) for column in stmt.selected_columns])
+    columns, parts = batches(session, stmt)
+    def write(part):
+        with pyarrow.parquet.ParquetWriter(part, schema) as writer:
+            for rows in parts:
+                data = dict(zip(columns, map(list, zip(*rows))))
+                writer.write_batch(pyarrow.RecordBatch.from_pydict(data, schema=schema))
+                rows_written(len(rows))
+    finish_file(path, write)
+
+
+def per_sheet(write_sheet):
+    # Wraps a single-sheet writer: file_path's stem gets a _<sheet> suffix
+    def write(sheets, file_path, progress):
+        stem, extension = os.path.splitext(file_path)
+        rows_written = progress('Exporting')
+        def export_sheet(session, name, stmt):
+            path = f"{stem}_{name}{extension}"
+            write_sheet(session, stmt, path, rows_written)
+            return path
+        return in_parallel(sheets, export_sheet)
+    return write
+
+
+# name -> (file extension, file dialog filter, writer)
+EXPORT_FORMATS = {
+    'XLSX': ('.xlsx', "Excel Files (*.xlsx)", write_xlsx_sheets),
+    'CSV': ('.csv', "CSV Files (*.csv)", per_sheet(write_csv)),
+    'JSON Lines': ('.jsonl', "JSON Lines Files (*.jsonl)", per_sheet(write_jsonl)),
+}
+if pyarrow is not None:
+    EXPORT_FORMATS['Parquet'] = ('.parquet', "Parquet Files (*.parquet)", per_sheet(write_parquet))
+
+DEFAULT_FORMAT = 'XLSX'
+
+
+def export_data(session, sheets, export_format, file_path, progress=None) -> list:
+    # Returns the paths written; progress receives (stage, rows done, total
+    # rows) and may be called from any of the export threads
+    total = sum(count_rows(session, stmt) for _, stmt in sheets)
+    lock = threading.Lock()
+
+    def stage_counter(stage):
+        done = 0
+        def rows_done(count):
+            nonlocal done
+            with lock:
+                done += count
+                if progress:
+                    progress(stage, done, total)
+        return rows_done
+
+    _, _, write = EXPORT_FORMATS[export_format]
+    return write(sheets, file_path, stage_counter)
+
+
+def last_export(session):
+    return session.execute(select(DataExport).order_by(DataExport.id.desc()).limit(1)).scalar()
+
+def run_export(session, export_format, file_path, delta=False, progress=None) -> list:
+    # Full or delta export of queries.EXPORT_SHEETS; with no previous
+    # export to compare against, a delta export is a full one
+    previous = last_export(session) if delta else None
+    watermark = session.execute(select(func.coalesce(func.max(ChangeLog.seq), 0))).scalar()
+    if previous is not None:
+        sheets = queries.delta_sheets(previous.last_change)
+    else:
+        sheets = queries.EXPORT_SHEETS
+
+    paths = export_data(session, sheets, export_format, file_path, progress)
+
+    session.add(DataExport(exported_at=datetime.now(), delta=previous is not None, last_change=watermark))
+    session.execute(delete(ChangeLog).where(ChangeLog.seq <= watermark))
+    session.commit()
+    return paths
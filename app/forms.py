@@ -1169,3 +1169,33 @@ class FilterCertificateForm(QDialog):
             'end_date': self.tbEndRecordDate.date()
         }
 
+class BatchCertificateForm(QDialog):
+    def __init__(self):
+        super().__init__()
+
+        self.setWindowTitle('Print Certificates')
+        main_layout = QVBoxLayout(self)
+
+        self.header = FormHeader('Print Certificates')
+        self.form = QWidget()
+        form_layout = QFormLayout(self.form)
+        self.addbar = AddBar()
+        self.addbar.btAdd.setText('Print')
+        self.cbScope = QComboBox()
+        self.cbScope.addItems(['ISSUED TODAY', 'SELECTED ROWS', 'CURRENT FILTER'])
+        self.cbOutput = QComboBox()
+        self.cbOutput.addItems(['FOLDER', 'ZIP FILE', 'PDF FILE'])
+
+        form_layout.addRow('Certificates: ', self.cbScope)
+        form_layout.addRow('Save To: ', self.cbOutput)
+
+        main_layout.addWidget(self.header)
+        main_layout.addWidget(self.form)
+        main_layout.addStretch()
+        main_layout.addWidget(self.addbar)
+
+    def get_fields(self):
+        return {
+            'scope': self.cbScope.currentText(),
+            'output': self.cbOutput.currentText()
+        }
@@ -0,0 +1,178 @@
+import re
+import unicodedata
+from sqlalchemy import text, table, column, literal_column, literal, func
+
+# Full-text indexes backing the search bars. Each index is an FTS5 table
+# whose rowid is the id of the row it mirrors; triggers keep it in sync
+# with the base tables, including the household and resident columns that
+# are copied into the resident and certificate indexes.
+
+class SearchIndex:
+    def __init__(self, name, columns, rows):
+        self.name = name
+        self.columns = columns
+        self.rows = rows
+        self.table = table(name, column('rowid'), column('rank'), *(column(c) for c in columns))
+
+    def ddl(self):
+        return f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.name} USING fts5({', '.join(self.columns)})"
+
+    def insert(self, where=""):
+        return f"INSERT INTO {self.name}(rowid, {', '.join(self.columns)}) {self.rows} {where}"
+
+    def delete(self, where):
+        return f"DELETE FROM {self.name} WHERE rowid IN ({where})"
+
+    def search(self, query, id_column, match):
+        # Returns the filtered query and the bm25 rank to order it by
+        query = (
+            query.join(self.table, self.table.c.rowid == id_column)
+            .filter(literal_column(self.name).op('MATCH')(match))
+        )
+        return query, self.table.c.rank
+
+    def text(self):
+        # Everything the index matched on, for filtering loaded rows in memory
+        text = func.coalesce(self.table.c[self.columns[0]], '')
+        for name in self.columns[1:]:
+            text = text + literal(' ') + func.coalesce(self.table.c[name], '')
+        return text.label('search_text')
+
+
+HOUSEHOLDS = SearchIndex(
+    'households_fts',
+    ['date_added', 'household_name', 'house_no', 'street', 'sitio', 'landmark'],
+    "SELECT h.id, h.date_added, h.household_name, h.house_no, h.street, h.sitio, h.landmark FROM households h"
+)
+
+RESIDENTS = SearchIndex(
+    'residents_fts',
+    ['date_added', 'first_name', 'middle_name', 'last_name', 'suffix', 'role',
+     'household_name', 'house_no', 'street', 'sitio', 'landmark'],
+    "SELECT r.id, r.date_added, r.first_name, r.middle_name, r.last_name, r.suffix, r.role, "
+    "h.household_name, h.house_no, h.street, h.sitio, h.landmark "
+    "FROM residents r LEFT JOIN households h ON h.id = r.household_id"
+)
+
+BLOTTERS = SearchIndex(
+    'blotters_fts',
+    ['record_date', 'complainant', 'respondent', 'status', 'full_report'],
+    "SELECT b.id, b.record_date, b.complainant, b.respondent, b.status, b.full_report FROM blotters b"
+)
+
+CERTIFICATES = SearchIndex(
+    'certificates_fts',
+    ['date_issued', 'type', 'purpose', 'first_name', 'middle_name', 'last_name', 'suffix'],
+    "SELECT c.id, c.date_issued, c.type, c.purpose, r.first_name, r.middle_name, r.last_name, r.suffix "
+    "FROM certificates c LEFT JOIN residents r ON r.id = c.resident_id"
+)
+
+INDEXES = [HOUSEHOLDS, RESIDENTS, BLOTTERS, CERTIFICATES]
+
+
+def sync_statements(index, where, select_ids):
+    return [
+        index.delete(select_ids),
+        index.insert(where),
+    ]
+
+# (trigger name, table, event, statements)
+TRIGGERS = [
+    ('households_fts_ai', 'households', 'AFTER INSERT', [
+        HOUSEHOLDS.insert("WHERE h.id = NEW.id"),
+    ]),
+    ('households_fts_au', 'households', 'AFTER UPDATE', [
+        *sync_statements(HOUSEHOLDS, "WHERE h.id = NEW.id", "OLD.id, NEW.id"),
+        *sync_statements(RESIDENTS, "WHERE r.household_id = NEW.id",
+                         "SELECT id FROM residents WHERE household_id = NEW.id"),
+    ]),
+    ('households_fts_ad', 'households', 'AFTER DELETE', [
+        HOUSEHOLDS.delete("OLD.id"),
+        *sync_statements(RESIDENTS, "WHERE r.household_id = OLD.id",
+                         "SELECT id FROM residents WHERE household_id = OLD.id"),
+    ]),
+    ('residents_fts_ai', 'residents', 'AFTER INSERT', [
+        RESIDENTS.insert("WHERE r.id = NEW.id"),
+    ]),
+    ('residents_fts_au', 'residents', 'AFTER UPDATE', [
+        *sync_statements(RESIDENTS, "WHERE r.id = NEW.id", "OLD.id, NEW.id"),
+        *sync_statements(CERTIFICATES, "WHERE c.resident_id = NEW.id",
+                         "SELECT id FROM certificates WHERE resident_id = NEW.id"),
+    ]),
+    ('residents_fts_ad', 'residents', 'AFTER DELETE', [
+        RESIDENTS.delete("OLD.id"),
+        *sync_statements(CERTIFICATES, "WHERE c.resident_id = OLD.id",
+                         "SELECT id FROM certificates WHERE resident_id = OLD.id"),
+    ]),
+    ('blotters_fts_ai', 'blotters', 'AFTER INSERT', [
+        BLOTTERS.insert("WHERE b.id = NEW.id"),
+    ]),
+    ('blotters_fts_au', 'blotters', 'AFTER UPDATE', [
+        *sync_statements(BLOTTERS, "WHERE b.id = NEW.id", "OLD.id, NEW.id"),
+    ]),
+    ('blotters_fts_ad', 'blotters', 'AFTER DELETE', [
+        BLOTTERS.delete("OLD.id"),
+    ]),
+    ('certificates_fts_ai', 'certificates', 'AFTER INSERT', [
+        CERTIFICATES.insert("WHERE c.id = NEW.id"),
+    ]),
+    ('certificates_fts_au', 'certificates', 'AFTER UPDATE', [
+        *sync_statements(CERTIFICATES, "WHERE c.id = NEW.id", "OLD.id, NEW.id"),
+    ]),
+    ('certificates_fts_ad', 'certificates', 'AFTER DELETE', [
+        CERTIFICATES.delete("OLD.id"),
+    ]),
+]
+
+
+def install_fts(conn):
+    existing = {
+        row[0] for row in conn.execute(text("SELECT name FROM sqlite_master WHERE type = 'table'"))
+    }
+
+    for index in INDEXES:
+        conn.execute(text(index.ddl()))
+        # Populate indexes that did not exist yet from the current data
+        if index.name not in existing:
+            conn.execute(text(index.insert()))
+
+    for name, table_name, event, statements in TRIGGERS:
+        body = "; ".join(statements)
+        conn.execute(text(f"CREATE TRIGGER IF NOT EXISTS {name} {event} ON {table_name} BEGIN {body}; END"))
+
+
+def match_query(search_text: str) -> str:
+    # Every term must match, each as a prefix, e.g. 'jo 2024' -> '"jo"* AND "2024"*'
+    terms = search_text.split()
+    return " AND ".join('"' + term.replace('"', '""') + '"*' for term in terms)
+
+
+# In-memory twin of the default unicode61 tokenizer: case-folded runs of
+# letters and digits with diacritics removed
+def tokens(value) -> list:
+    value = unicodedata.normalize('NFKD', str(value))
+    value = ''.join(c for c in value if not unicodedata.combining(c))
+    return re.findall(r'[^\W_]+', value.casefold())
+
+def search_terms(search_text: str):
+    # The prefix terms of a search, or None when a term is a phrase (e.g.
+    # 'jo-ann') that only SQLite should evaluate
+    terms = []
+    for term in search_text.split():
+        words = tokens(term)
+        if len(words) != 1:
+            return None
+        terms.append(words[0])
+    return terms
+
+def narrows(previous, terms) -> bool:
+    # True when every row matching terms also matches previous: each old
+    # term is a prefix of some new term
+    if previous is None or terms is None:
+        return False
+    return all(any(term.startswith(old) for term in terms) for old in previous)
+
+def matches(value, terms) -> bool:
+    words = tokens(value)
+    return all(any(word.startswith(term) for word in words) for term in terms)
+
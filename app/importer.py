@@ -0,0 +1,179 @@
+import csv
+import os
+from datetime import date, datetime
+from sqlalchemy import select, insert
+from openpyxl import load_workbook
+from model import Household, Resident
+import queries
+import stats
+
+# Bulk import of residents from an RBI sheet, in the layout the export
+# writes (XLSX with an 'RBI' sheet, or its CSV). Duplicates are checked
+# in memory against an index of the household names and resident names
+# already in the database, loaded once, instead of one query per row.
+# Accepted rows are inserted with executemany in batches, each batch in
+# its own transaction. Rejected rows are written to <file>_rejected.csv
+# with the reason. The inserts bypass the ORM, so the dashboard charts
+# they affect are marked stale rather than updated through session events.
+
+IMPORT_BATCH = 500
+
+RESIDENT_FIELDS = [c.key for c in queries.RESIDENT_EXPORT_COLUMNS if c.class_ is Resident]
+HOUSEHOLD_FIELDS = [c.key for c in queries.RESIDENT_EXPORT_COLUMNS if c.class_ is Household]
+IMPORTED_CHARTS = stats.RESIDENT_CHARTS | {stats.ENTITIES}
+
+
+class ImportResult:
+    def __init__(self):
+        self.residents = 0
+        self.households = 0
+        self.rejected = []  # (row number, values, reason)
+        self.rejected_path = None
+
+
+def read_rows(file_path):
+    # (header, data rows) of the RBI sheet
+    if file_path.lower().endswith('.csv'):
+        with open(file_path, newline='', encoding='utf-8-sig') as f:
+            rows = list(csv.reader(f))
+    else:
+        workbook = load_workbook(file_path, read_only=True)
+        try:
+            worksheet = workbook['RBI'] if 'RBI' in workbook.sheetnames else workbook.active
+            rows = [list(row) for row in worksheet.iter_rows(values_only=True)]
+        finally:
+            workbook.close()
+    if not rows:
+        raise ValueError("The file is empty.")
+    header = [str(name).strip().lower() if name is not None else '' for name in rows[0]]
+    missing = [name for name in ('first_name', 'last_name', 'household_name') if name not in header]
+    if missing:
+        raise ValueError(f"Missing columns: {', '.join(missing)}")
+    return header, rows[1:]
+
+
+def text_value(value) -> str:
+    return str(value).strip().upper() if value is not None else ''
+
+def date_value(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    if value is None or not str(value).strip():
+        raise ValueError("Date of birth cannot be empty")
+    try:
+        return date.fromisoformat(str(value).strip()[:10])
+    except ValueError:
+        raise ValueError(f"Invalid date of birth '{value}'")
+
+def resident_key(first_name, last_name, middle_name, suffix):
+    # Same fields as the duplicate check of the Add Resident form
+    return tuple(text_value(value) for value in (first_name, last_name, middle_name, suffix))
+
+
+def load_index(session):
+    households = {
+        text_value(name): household_id
+        for household_id, name in session.execute(select(Household.id, Household.household_name))
+    }
+    residents = {
+        resident_key(*names)
+        for names in session.execute(select(
+            Resident.first_name, Resident.last_name, Resident.middle_name, Resident.suffix
+        ))
+    }
+    return households, residents
+
+
+def parse_row(header, values):
+    record = dict(zip(header, values))
+    resident = {field: text_value(record.get(field)) for field in RESIDENT_FIELDS}
+    household = {field: text_value(record.get(field)) for field in HOUSEHOLD_FIELDS}
+
+    if not resident['first_name'] or not resident['last_name']:
+        raise ValueError("First name and Last name cannot be empty")
+    if not resident['citizenship']:
+        raise ValueError("Citizenship cannot be empty")
+    if not household['household_name']:
+        raise ValueError("Household name cannot be empty")
+    resident['date_of_birth'] = date_value(record.get('date_of_birth'))
+    return resident, household
+
+
+def insert_batch(session, batch, households):
+    # batch: (resident, household) pairs; households with no id yet are
+    # inserted first so their residents can refer to them
+    new_households = []
+    for _, household in batch:
+        name = household['household_name']
+        if name not in households:
+            households[name] = None
+            new_households.append(household)
+
+    if new_households:
+        ids = session.scalars(
+            insert(Household).returning(Household.id, sort_by_parameter_order=True),
+            new_households
+        ).all()
+        for household, household_id in zip(new_households, ids):
+            households[household['household_name']] = household_id
+
+    session.execute(insert(Resident), [
+        {**resident, 'household_id': households[household['household_name']]}
+        for resident, household in batch
+    ])
+    stats.cache.mark_stale(session, IMPORTED_CHARTS)
+    session.commit()
+    return len(new_households)
+
+
+def write_rejected(file_path, header, rejected):
+    stem, _ = os.path.splitext(file_path)
+    path = f"{stem}_rejected.csv"
+    with open(path, 'w', newline='', encoding='utf-8-sig') as f:
+        writer = csv.writer(f)
+        writer.writerow(['row', 'reason', *header])
+        for number, values, reason in rejected:
+            writer.writerow([number, reason, *values])
+    return path
+
+
+def import_residents(session, file_path, progress=None) -> ImportResult:
+    # progress receives (rows done, total rows)
+    header, rows = read_rows(file_path)
+    households, residents = load_index(session)
+    result = ImportResult()
+
+    batch = []
+    for number, values in enumerate(rows, start=2):
+        if all(value is None or str(value).strip() == '' for value in values):
+            continue
+        try:
+            resident, household = parse_row(header, values)
+            key = resident_key(resident['first_name'], resident['last_name'],
+                               resident['middle_name'], resident['suffix'])
+            if key in residents:
+                raise ValueError("Resident already exists")
+        except ValueError as e:
+            result.rejected.append((number, values, str(e)))
+            continue
+
+        residents.add(key)
+        batch.append((resident, household))
+        if len(batch) == IMPORT_BATCH:
+            result.households += insert_batch(session, batch, households)
+            result.residents += len(batch)
+            batch = []
+            if progress:
+                progress(number - 1, len(rows))
+
+    if batch:
+        result.households += insert_batch(session, batch, households)
+        result.residents += len(batch)
+    if progress:
+        progress(len(rows), len(rows))
+
+    if result.rejected:
+        result.rejected_path = write_rejected(file_path, header, result.rejected)
+    return result
@@ -7,6 +7,8 @@ from resources_rc import *
 from wizard import InitWizard
 from base import Database
 from model import User
+import stats
+import multiprocessing
 import sys
 
 def main():
@@ -19,6 +21,8 @@ def main():
         app.setStyleSheet(stream.readAll())
 
     db = Database()
+    # Keep the dashboard totals in step with every write from here on
+    stats.install()
     session = db.get_session()
 
     if session.query(User).all():
@@ -31,4 +35,6 @@ def main():
         wizard.exec()
 
 if __name__ == "__main__":
+    # Batch printing starts worker processes; needed in the frozen build
+    multiprocessing.freeze_support()
     main()
@@ -0,0 +1,40 @@
+from sqlalchemy import text
+from fts import install_fts
+from changelog import install_change_log
+
+# Schema changes that Base.metadata.create_all cannot apply to an existing
+# main.sqlite. The database's PRAGMA user_version records how many of
+# these steps have run; Database() applies the rest in order at startup.
+# New steps go at the end of MIGRATIONS. Each step also runs on a freshly
+# created database, so it must tolerate objects that already exist.
+
+def create_indexes(conn, metadata):
+    # checkfirst cannot see expression indexes, so compare names directly
+    existing = {
+        row[0] for row in conn.execute(text("SELECT name FROM sqlite_master WHERE type = 'index'"))
+    }
+
+    for table in metadata.sorted_tables:
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(conn)
+
+def create_search_indexes(conn, metadata):
+    install_fts(conn)
+
+def create_change_log(conn, metadata):
+    install_change_log(conn)
+
+MIGRATIONS = [
+    create_search_indexes,
+    create_indexes,
+    create_change_log,
+]
+
+def migrate(engine, metadata):
+    with engine.begin() as conn:
+        version = conn.execute(text("PRAGMA user_version")).scalar()
+
+        for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+            migration(conn, metadata)
+            conn.execute(text(f"PRAGMA user_version = {number}"))
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Date, ForeignKey
+from sqlalchemy import Column, Integer, String, Date, DateTime, Boolean, ForeignKey, Index, func
 from sqlalchemy.orm import relationship
 from base import Base
 import datetime
@@ -23,7 +23,7 @@ class Resident(BaseModel):
 
 
     first_name = Column(String)
-    last_name = Column(String)
+    last_name = Column(String, index=True)
     middle_name = Column(String)
     suffix = Column(String)
     date_of_birth = Column(Date)
@@ -37,23 +37,34 @@ class Resident(BaseModel):
     phone2 = Column(String)
     email = Column(String)
     role = Column(String)
-    household_id = Column(ForeignKey("households.id"))
+    household_id = Column(ForeignKey("households.id"), index=True)
     
     household = relationship("Household", back_populates="residents")
     user = relationship("User", back_populates='resident')
     certificates = relationship("Certificate")
 
+    # Duplicate resident check
+    __table_args__ = (
+        Index('ix_residents_upper_name', func.upper(last_name), func.upper(first_name),
+              func.upper(middle_name), func.upper(suffix)),
+    )
+
 
 class Household(BaseModel):
     __tablename__ = "households"
 
-    household_name = Column(String)
+    household_name = Column(String, index=True)
     house_no = Column(String)
     street = Column(String)
-    sitio = Column(String)
+    sitio = Column(String, index=True)
     landmark = Column(String)
     residents = relationship(Resident)
 
+    # Duplicate household name check
+    __table_args__ = (
+        Index('ix_households_upper_household_name', func.upper(household_name)),
+    )
+
 class User(BaseModel):
     __tablename__ = "users"
 
@@ -67,7 +78,7 @@ class User(BaseModel):
 class Blotter(BaseModel):
     __tablename__ = "blotters"
 
-    record_date = Column(Date)
+    record_date = Column(Date, index=True)
     status = Column(String)
     action_taken = Column(String)
     nature_of_dispute = Column(String)
@@ -78,13 +89,45 @@ class Blotter(BaseModel):
 class Certificate(BaseModel):
     __tablename__ = "certificates"
     
-    date_issued = Column(Date)
+    date_issued = Column(Date, index=True)
     type = Column(String)
     purpose = Column(String)
-    resident_id = Column(ForeignKey("residents.id"))
+    resident_id = Column(ForeignKey("residents.id"), index=True)
     
     resident = relationship("Resident", back_populates='certificates')
 
+# Persisted dashboard statistics, kept up to date by stats.py
+class DashboardChart(Base):
+    __tablename__ = 'dashboard_charts'
+
+    chart = Column(String, primary_key=True)
+    computed_on = Column(Date)
+    stale = Column(Boolean, default=False)
+
+class DashboardStat(Base):
+    __tablename__ = 'dashboard_stats'
 
+    chart = Column(String, primary_key=True)
+    category = Column(String, primary_key=True)
+    total = Column(Integer, default=0)
 
+# Every insert, update and delete of the exported tables, written by the
+# triggers in changelog.py, so a delta export can pick out changed rows
+class ChangeLog(Base):
+    __tablename__ = 'change_log'
+    __table_args__ = {'sqlite_autoincrement': True}
 
+    seq = Column(Integer, primary_key=True)
+    table_name = Column(String, nullable=False)
+    row_id = Column(Integer, nullable=False)
+    operation = Column(String, nullable=False)
+    changed_at = Column(DateTime)
+
+# One row per finished export; last_change is the change_log watermark
+class DataExport(Base):
+    __tablename__ = 'data_exports'
+
+    id = Column(Integer, primary_key=True)
+    exported_at = Column(DateTime)
+    delta = Column(Boolean, default=False)
+    last_change = Column(Integer, default=0)
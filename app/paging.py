@@ -0,0 +1,74 @@
+from contextlib import contextmanager
+from sqlalchemy import and_, or_, desc
+from base import Database
+
+PAGE_SIZE = 200
+
+@contextmanager
+def using(session=None):
+    # The given session (e.g. a worker's), else a unit of work of our own
+    if session is not None:
+        yield session
+    else:
+        with Database().unit_of_work() as session:
+            yield session
+
+# Fetches a list query's rows as tuples one page at a time, using keyset
+# pagination on (sort column, id) so each page is an index range scan no
+# matter how far the user has scrolled. SQLite sorts NULLs first ascending and last
+# descending; the keyset predicate follows the same rule. The total row
+# count is a separate COUNT(*), run only when a window shows it: a window
+# column on the first page would make SQLite sort the whole result before
+# applying the LIMIT.
+class KeysetPager:
+    def __init__(self, query, sort_column, id_column, descending=False, page_size=PAGE_SIZE):
+        self.query = query.order_by(None)
+        self.sort_column = sort_column
+        self.id_column = id_column
+        self.descending = descending
+        self.page_size = page_size
+        self.last_key = None
+        self.exhausted = False
+        self.total = None
+
+    def count(self, session=None) -> int:
+        if self.total is None:
+            with using(session) as session:
+                self.total = self.query.with_session(session).count()
+        return self.total
+
+    def after(self, key, last_id):
+        sort, id_ = self.sort_column, self.id_column
+
+        if self.descending:
+            if key is None:
+                return and_(sort.is_(None), id_ < last_id)
+            return or_(sort < key, and_(sort == key, id_ < last_id), sort.is_(None))
+
+        if key is None:
+            return or_(and_(sort.is_(None), id_ > last_id), sort.isnot(None))
+        return or_(sort > key, and_(sort == key, id_ > last_id))
+
+    def next_page(self, session=None) -> list:
+        if self.exhausted:
+            return []
+
+        keys = [self.sort_column, self.id_column]
+        query = self.query.add_columns(*keys)
+        if self.last_key is not None:
+            query = query.filter(self.after(*self.last_key))
+
+        if self.descending:
+            query = query.order_by(desc(self.sort_column), desc(self.id_column))
+        else:
+            query = query.order_by(self.sort_column, self.id_column)
+
+        with using(session) as session:
+            rows = query.limit(self.page_size).with_session(session).all()
+
+        if len(rows) < self.page_size:
+            self.exhausted = True
+        if rows:
+            self.last_key = tuple(rows[-1][-len(keys):])
+
+        return [tuple(row[:-len(keys)]) for row in rows]
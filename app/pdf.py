@@ -0,0 +1,416 @@
+import html
+import os
+import threading
+import time
+from PySide6.QtCore import QMarginsF, QPointF, QRect, QRectF, QSizeF, QUrl
+from PySide6.QtGui import QColor, QImage, QPageLayout, QPageSize, QPainter, QPdfWriter, QTextDocument
+import documents
+
+# PDF certificates drawn by Qt, without Word. Each compiled DOCX template
+# is converted once into an HTML layout for QTextDocument: paragraphs
+# with their alignment, spacing and run formatting, tables, and the
+# template's pictures. The placeholder runs become slots the same way as
+# in the DOCX renderer, so a render only fills the slots in and lays the
+# page out. Layouts are cached with the compiled template they came from
+# and follow its mtime invalidation. Several certificates can be drawn
+# into one PDF, one after the other.
+#
+# The conversion is close to Word's layout, not identical. Pictures placed
+# behind the text (watermarks, seals) are drawn under the page at their
+# anchored position instead of flowing with it, and the runs of spaces
+# and tabs the templates use to push signature lines to the right become
+# a paragraph indent, since Qt would wrap the line at them.
+
+PDF_RESOLUTION = 300
+EMU_PER_INCH = 914400
+EMU_PER_POINT = 12700
+TAB_STOP_INCHES = 0.5
+# Width of a space relative to the font size, for leading whitespace
+SPACE_WIDTH = 0.25
+# Leading whitespace never indents a paragraph by more of its width
+MAX_INDENT = 0.7
+# a:srcRect crops and a:lum adjustments are in thousandths of a percent
+DRAWING_PERCENT = 100000
+
+# w:jc values; read from the XML since python-docx rejects some of them
+ALIGNMENTS = {
+    'center': 'center',
+    'right': 'right',
+    'end': 'right',
+    'both': 'justify',
+    'distribute': 'justify',
+}
+
+
+def points(length) -> float:
+    return length / EMU_PER_POINT
+
+def device_pixels(emu) -> int:
+    return round(emu * PDF_RESOLUTION / EMU_PER_INCH)
+
+
+class PdfLayout:
+    def __init__(self, template: documents.CompiledTemplate):
+        self.template = template
+        doc = template.doc
+        section = doc.sections[0]
+        self.page_size = QPageSize(QSizeF(points(section.page_width), points(section.page_height)), QPageSize.Point)
+        self.margins = QMarginsF(
+            points(section.left_margin), points(section.top_margin),
+            points(section.right_margin), points(section.bottom_margin)
+        )
+        self.column_width = section.page_width - section.left_margin - section.right_margin
+        self.slots = {run._r: number for number, (run, _, _) in enumerate(template.runs)}
+        self.images = {}
+        # (image name, anchor name, horizontal, vertical, width, height); the
+        # positions are (relativeFrom, posOffset, align) of the anchor
+        self.backgrounds = []
+        # Alternating literal HTML and slot numbers
+        self.chunks = []
+        self.text = []
+        self.body(doc)
+        self.flush()
+
+    def write(self, text):
+        self.text.append(text)
+
+    def flush(self):
+        self.chunks.append("".join(self.text))
+        self.text = []
+
+    def body(self, doc):
+        self.write('<body style="white-space: pre-wrap">')
+        for block in doc.iter_inner_content():
+            if hasattr(block, 'rows'):
+                self.table(block)
+            else:
+                self.paragraph(block, self.column_width)
+        self.write('</body>')
+
+    def table(self, table):
+        self.write('<table width="100%" cellspacing="0" cellpadding="4">')
+        for row in table.rows:
+            self.write('<tr>')
+            total = sum(cell.width or 0 for cell in row.cells) or 1
+            for cell in row.cells:
+                width = round(100 * (cell.width or 0) / total)
+                self.write(f'<td valign="top" width="{width}%">')
+                for paragraph in cell.paragraphs:
+                    self.paragraph(paragraph, cell.width or self.column_width)
+                self.write('</td>')
+            self.write('</tr>')
+        self.write('</table>')
+
+    def leading_whitespace(self, paragraph, width) -> tuple:
+        # (indent in points, {run element: characters to skip}) for the
+        # spaces and tabs the paragraph starts with
+        tab = TAB_STOP_INCHES * 72
+        indent = 0.0
+        skip = {}
+        for run in paragraph.runs:
+            if run._r in self.slots:
+                return min(indent, MAX_INDENT * points(width)), skip
+            text = run.text
+            stripped = text.lstrip(' \t')
+            size = run.font.size or paragraph.style.font.size
+            space = (size.pt if size else 11) * SPACE_WIDTH
+            for character in text[:len(text) - len(stripped)]:
+                indent = (indent // tab + 1) * tab if character == '\t' else indent + space
+            skip[run._r] = len(text) - len(stripped)
+            if stripped:
+                return min(indent, MAX_INDENT * points(width)), skip
+        # Word keeps a blank paragraph to one line, however many spaces
+        return 0.0, skip
+
+    def paragraph(self, paragraph, width):
+        fmt = paragraph.paragraph_format
+        style = paragraph.style.paragraph_format
+        before = fmt.space_before if fmt.space_before is not None else style.space_before
+        after = fmt.space_after if fmt.space_after is not None else style.space_after
+        jc = paragraph._p.xpath('string(./w:pPr/w:jc/@w:val)') or paragraph.style.element.xpath('string(./w:pPr/w:jc/@w:val)')
+        align = ALIGNMENTS.get(jc, 'left')
+        indent, skip = self.leading_whitespace(paragraph, width)
+        self.write(
+            f'<p align="{align}" style="margin-top: {points(before or 0):.1f}pt; '
+            f'margin-bottom: {points(after or 0):.1f}pt; margin-left: {indent:.1f}pt">'
+        )
+        empty = True
+        for run in paragraph.runs:
+            empty = self.run(paragraph, run, skip.get(run._r, 0)) and empty
+        if empty:
+            self.write('&nbsp;')
+        self.write('</p>')
+
+    def run(self, paragraph, run, skip=0) -> bool:
+        # Writes the run without its first skip characters; returns whether
+        # it had no visible content
+        for blip in run._r.xpath('.//a:blip/@r:embed'):
+            self.image(run, blip)
+
+        font = run.font
+        style_font = paragraph.style.font
+        css = []
+        size = font.size or style_font.size
+        if size:
+            css.append(f'font-size: {size.pt:.1f}pt')
+        name = font.name or style_font.name
+        if name:
+            css.append(f"font-family: '{name}'")
+        if run.bold if run.bold is not None else style_font.bold:
+            css.append('font-weight: bold')
+        if run.italic if run.italic is not None else style_font.italic:
+            css.append('font-style: italic')
+        if run.underline:
+            css.append('text-decoration: underline')
+        self.write(f'<span style="{"; ".join(css)}">')
+        if run._r in self.slots:
+            self.flush()
+            self.chunks.append(self.slots[run._r])
+            empty = False
+        else:
+            text = run.text[skip:]
+            self.write(html.escape(text))
+            empty = not text
+        self.write('</span>')
+        return empty
+
+    def image(self, run, relationship_id):
+        part = run.part.related_parts[relationship_id]
+        drawing = run._r.xpath('.//w:drawing')[0]
+        name = f"image{len(self.images)}"
+        self.images[name] = washed_out(cropped(QImage.fromData(part.blob), drawing), drawing)
+        width = int(drawing.xpath('string(.//wp:extent/@cx)') or 0)
+        height = int(drawing.xpath('string(.//wp:extent/@cy)') or 0)
+        anchor = drawing.xpath('./wp:anchor')
+        if anchor and anchor[0].get('behindDoc') == '1':
+            # Drawn under the page by draw(); the HTML only marks where
+            # the paragraph it is anchored to ends up
+            anchor_name = f"background{len(self.backgrounds)}"
+            horizontal, vertical = (
+                (
+                    drawing.xpath(f'string(./wp:anchor/wp:{axis}/@relativeFrom)'),
+                    drawing.xpath(f'string(./wp:anchor/wp:{axis}/wp:posOffset)'),
+                    drawing.xpath(f'string(./wp:anchor/wp:{axis}/wp:align)'),
+                )
+                for axis in ('positionH', 'positionV')
+            )
+            self.backgrounds.append((name, anchor_name, horizontal, vertical, width, height))
+            self.write(f'<a name="{anchor_name}">&#8288;</a>')
+            return
+        offset = drawing.xpath('string(.//wp:positionH/wp:posOffset)')
+        # Floating pictures go to the side of the column they sit on
+        side = 'left'
+        if offset and int(offset) + width / 2 > self.column_width / 2:
+            side = 'right'
+        float_style = f' style="float: {side}"' if anchor else ''
+        self.write(
+            f'<img src="{name}" width="{device_pixels(width)}" height="{device_pixels(height)}"{float_style}>'
+        )
+
+    def position(self, anchor_position, size, frame, margin) -> int:
+        # Offset in EMU from the column or top margin, for a position
+        # relative to the page, the margins or the column
+        relative_from, offset, align = anchor_position
+        if relative_from == 'page':
+            start, length = -margin, frame
+        else:
+            start, length = 0, frame - 2 * margin
+        if offset:
+            return start + int(offset)
+        if align in ('center', 'inside'):
+            return start + (length - size) // 2
+        if align in ('right', 'bottom', 'outside'):
+            return start + length - size
+        return start
+
+    def background_rects(self, doc: QTextDocument) -> list:
+        # (image, rect in document coordinates) of the pictures behind text
+        anchors = {}
+        block = doc.begin()
+        while block.isValid():
+            fragments = block.begin()
+            while not fragments.atEnd():
+                for anchor_name in fragments.fragment().charFormat().anchorNames():
+                    anchors[anchor_name] = doc.documentLayout().blockBoundingRect(block).top()
+                fragments += 1
+            block = block.next()
+
+        section = self.template.doc.sections[0]
+        page_height = doc.pageSize().height()
+        rects = []
+        for name, anchor_name, horizontal, vertical, width, height in self.backgrounds:
+            if anchor_name not in anchors:
+                continue
+            top = anchors[anchor_name]
+            x = self.position(horizontal, width, section.page_width, section.left_margin)
+            y = device_pixels(self.position(vertical, height, section.page_height, section.top_margin))
+            if vertical[0] in ('paragraph', 'line'):
+                y += top
+            else:
+                # Relative to the page the paragraph is on
+                y += (top // page_height) * page_height
+            rects.append((
+                self.images[name],
+                QRectF(device_pixels(x), y, device_pixels(width), device_pixels(height))
+            ))
+        return rects
+
+    def document(self, replacements: dict, writer: QPdfWriter) -> QTextDocument:
+        values = [html.escape(text) for text in self.template.run_texts(replacements)]
+        doc = QTextDocument()
+        doc.documentLayout().setPaintDevice(writer)
+        for name, image in self.images.items():
+            doc.addResource(QTextDocument.ImageResource, QUrl(name), image)
+        doc.setDocumentMargin(0)
+        doc.setHtml("".join(values[chunk] if isinstance(chunk, int) else chunk for chunk in self.chunks))
+        option = doc.defaultTextOption()
+        option.setTabStopDistance(TAB_STOP_INCHES * PDF_RESOLUTION)
+        doc.setDefaultTextOption(option)
+        doc.setPageSize(QSizeF(writer.width(), writer.height()))
+        return doc
+
+
+def cropped(image: QImage, drawing) -> QImage:
+    crop = drawing.xpath('.//a:srcRect')
+    if not crop or image.isNull():
+        return image
+    # Negative values pad the picture instead; those are left alone
+    left, top, right, bottom = (
+        max(int(crop[0].get(side, 0)), 0) / DRAWING_PERCENT for side in ('l', 't', 'r', 'b')
+    )
+    width, height = image.width(), image.height()
+    return image.copy(QRect(
+        round(left * width), round(top * height),
+        round((1 - left - right) * width), round((1 - top - bottom) * height)
+    ))
+
+
+def washed_out(image: QImage, drawing) -> QImage:
+    # a:lum brightness and contrast, which Word uses to wash watermarks
+    # out; both map each channel linearly, so together they are a blend of
+    # the picture with a grey. Adjustments that are not a blend are left out
+    lum = drawing.xpath('.//a:blip/a:lum')
+    if not lum or image.isNull():
+        return image
+    bright = int(lum[0].get('bright', 0)) / DRAWING_PERCENT
+    contrast = int(lum[0].get('contrast', 0)) / DRAWING_PERCENT
+    scale, shift = 1 + contrast, -contrast / 2
+    if bright >= 0:
+        scale, shift = scale * (1 - bright), shift * (1 - bright) + bright
+    else:
+        scale, shift = scale * (1 + bright), shift * (1 + bright)
+    if not 0 <= scale < 1 or not 0 <= shift <= 1 - scale:
+        return image
+    grey = shift / (1 - scale)
+    image = image.convertToFormat(QImage.Format_ARGB32_Premultiplied)
+    painter = QPainter(image)
+    painter.setCompositionMode(QPainter.CompositionMode_SourceAtop)
+    painter.setOpacity(1 - scale)
+    painter.fillRect(image.rect(), QColor.fromRgbF(grey, grey, grey))
+    painter.end()
+    return image
+
+
+class LayoutCache:
+    def __init__(self):
+        self.layouts = {}
+        self.lock = threading.Lock()
+
+    def get(self, path) -> PdfLayout:
+        template = documents.templates.get(path)
+        with self.lock:
+            layout = self.layouts.get(path)
+            if layout is not None and layout.template is template:
+                return layout
+        layout = PdfLayout(template)
+        with self.lock:
+            self.layouts[path] = layout
+        return layout
+
+
+layouts = LayoutCache()
+
+
+def draw_page(painter, doc, backgrounds, number):
+    # Draws page number of the document, with the painter at its top left
+    page = QRectF(QPointF(0, 0), doc.pageSize())
+    area = page.translated(0, number * page.height())
+    painter.save()
+    painter.translate(0, -area.top())
+    for image, rect in backgrounds:
+        if rect.intersects(area):
+            painter.drawImage(rect, image)
+    doc.drawContents(painter, area)
+    painter.restore()
+
+def draw(painter, writer, layout, doc):
+    backgrounds = layout.background_rects(doc)
+    for number in range(doc.pageCount()):
+        if number:
+            writer.newPage()
+        draw_page(painter, doc, backgrounds, number)
+
+
+def draw_pdf(items, path, progress=None):
+    writer = QPdfWriter(path)
+    writer.setResolution(PDF_RESOLUTION)
+    writer.setCreator("BRIMA")
+    painter = None
+    try:
+        for done, (certificate_type, replacements) in enumerate(items, start=1):
+            layout = layouts.get(documents.template_path(certificate_type))
+            # A new page layout applies from the next page on
+            writer.setPageSize(layout.page_size)
+            writer.setPageMargins(layout.margins, QPageLayout.Point)
+            if painter is None:
+                painter = QPainter(writer)
+            else:
+                writer.newPage()
+            draw(painter, writer, layout, layout.document(replacements, writer))
+            if progress:
+                progress(done, len(items))
+    finally:
+        # Ending the painter writes and closes the file
+        if painter is not None:
+            painter.end()
+        del writer
+
+def write_pdf(items, save_path, progress=None):
+    # items: (certificate type, replacements) pairs, drawn one after the
+    # other into one PDF; progress receives (certificates done, total)
+    items = list(items)
+    if not items:
+        raise ValueError("No certificates to print.")
+    # Only a complete file ever carries the chosen name
+    part = save_path + '.part'
+    try:
+        draw_pdf(items, part, progress)
+        os.replace(part, save_path)
+    finally:
+        if os.path.exists(part):
+            os.remove(part)
+
+
+def render_certificate(certificate, save_path):
+    write_pdf([(certificate.type, documents.certificate_replacements(certificate))], save_path)
+
+
+def render_batch(jobs, destination, progress=None) -> documents.BatchResult:
+    # documents.batch_jobs jobs, drawn into the one PDF at destination; a
+    # certificate with no usable template is reported and left out
+    result = documents.BatchResult()
+    result.destination = destination
+    started = time.perf_counter()
+    items = []
+    for certificate_id, certificate_type, replacements, _ in jobs:
+        try:
+            layouts.get(documents.template_path(certificate_type))
+        except Exception as e:
+            result.failures.append((certificate_id, str(e)))
+            continue
+        items.append((certificate_type, replacements))
+    if items:
+        write_pdf(items, destination, progress)
+        result.rendered = len(items)
+    result.seconds = time.perf_counter() - started
+    return result
@@ -0,0 +1,232 @@
+from sqlalchemy import func, case, literal, literal_column, select, union_all, cast, or_, Integer
+from sqlalchemy.orm import join
+from model import Household, Resident, User, Blotter, Certificate, ChangeLog
+from paging import KeysetPager
+
+# Columns shown by the list windows, in header order with the id first.
+# They are selected straight from SQL, names and addresses included, so
+# the grids never hydrate ORM objects.
+
+class RowQuery:
+    def __init__(self, columns, sort_column, id_column, descending=False):
+        self.columns = columns
+        self.sort_column = sort_column
+        self.id_column = id_column
+        self.descending = descending
+
+    def pager(self, query) -> KeysetPager:
+        return KeysetPager(query.with_entities(*self.columns), self.sort_column, self.id_column, self.descending)
+
+    def ranked_pager(self, query, rank, *extra) -> KeysetPager:
+        # extra columns come after the shown ones and stay hidden
+        return KeysetPager(query.with_entities(*self.columns, *extra), rank, self.id_column)
+
+
+def join_words(*columns):
+    # SQL version of " ".join(filter(None, columns))
+    text = func.coalesce(columns[0], '')
+    for column in columns[1:]:
+        text = text + func.coalesce(literal(' ') + func.nullif(column, ''), '')
+    return func.ltrim(text)
+
+
+HOUSEHOLD_ROWS = RowQuery([
+    Household.id,
+    Household.date_added,
+    Household.household_name,
+    join_words(Household.house_no, Household.street, Household.sitio, Household.landmark).label('address'),
+], Household.household_name, Household.id)
+
+RESIDENT_ROWS = RowQuery([
+    Resident.id,
+    Resident.date_added,
+    Resident.role,
+    func.trim(
+        func.coalesce(Resident.last_name, '') + ', '
+        + join_words(Resident.first_name, Resident.middle_name, Resident.suffix)
+    ).label('full_name'),
+    Resident.sex,
+    case((Household.id.is_(None), 'N/A'), else_=Household.household_name).label('household_name'),
+    Resident.date_of_birth,
+    Resident.civil_status,
+    Resident.remarks,
+    join_words(Household.house_no, Household.street, Household.sitio, Household.landmark).label('address'),
+], Resident.last_name, Resident.id)
+
+USER_ROWS = RowQuery([
+    User.id,
+    User.date_added,
+    User.username,
+    User.position,
+    join_words(Resident.first_name, Resident.middle_name, Resident.last_name, Resident.suffix).label('full_name'),
+], User.id, User.id)
+
+BLOTTER_ROWS = RowQuery([
+    Blotter.id,
+    Blotter.record_date,
+    Blotter.complainant,
+    Blotter.respondent,
+    Blotter.status,
+    func.substr(Blotter.full_report, 1, 20).label('report'),
+], Blotter.record_date, Blotter.id, descending=True)
+
+CERTIFICATE_ROWS = RowQuery([
+    Certificate.id,
+    Certificate.date_issued,
+    Certificate.type,
+    join_words(Resident.first_name, Resident.middle_name, Resident.last_name, Resident.suffix).label('full_name'),
+    Certificate.purpose,
+], Certificate.date_issued, Certificate.id, descending=True)
+
+
+# Dashboard aggregates: entity totals in one row, and every distribution
+# chart as (chart, category, total) rows of a single UNION ALL.
+
+AGE_GROUPS = ["0-17", "18-30", "31-59", "60+"]
+
+def age_years():
+    # Whole years as (days since birth) // 365
+    return cast(
+        (func.julianday(func.date('now', 'localtime')) - func.julianday(Resident.date_of_birth)) / 365,
+        Integer
+    )
+
+def age_group():
+    # Bucketed like the original pandas.cut(bins=[-inf, 17, 30, 59, inf], right=False)
+    age = age_years()
+    return case(
+        (age < 17, AGE_GROUPS[0]),
+        (age < 30, AGE_GROUPS[1]),
+        (age < 59, AGE_GROUPS[2]),
+        else_=AGE_GROUPS[3]
+    )
+
+def age_group_of(date_of_birth, today):
+    # Python twin of age_group() for rows that are not in the database yet
+    age = (today - date_of_birth).days // 365
+    if age < 17:
+        return AGE_GROUPS[0]
+    if age < 30:
+        return AGE_GROUPS[1]
+    if age < 59:
+        return AGE_GROUPS[2]
+    return AGE_GROUPS[3]
+
+def distribution(chart, category, source, null_check=None):
+    null_check = category if null_check is None else null_check
+    return (
+        select(literal(chart).label('chart'), category.label('category'), func.count().label('total'))
+        .select_from(source)
+        .where(null_check.isnot(None))
+        .group_by(category)
+    )
+
+DASHBOARD_ENTITIES = ['households', 'residents', 'blotters', 'certificates']
+
+DASHBOARD_COUNTS = select(
+    select(func.count()).select_from(Household).scalar_subquery().label('households'),
+    select(func.count()).select_from(Resident).scalar_subquery().label('residents'),
+    select(func.count()).select_from(Blotter).scalar_subquery().label('blotters'),
+    select(func.count()).select_from(Certificate).scalar_subquery().label('certificates'),
+)
+
+DASHBOARD_CHARTS = {
+    'sitio': distribution('sitio', Household.sitio, join(Resident, Household, Resident.household)),
+    'age': distribution('age', age_group(), Resident, Resident.date_of_birth),
+    'sex': distribution('sex', Resident.sex, Resident),
+    'civil_status': distribution('civil_status', Resident.civil_status, Resident),
+    'blotter_status': distribution('blotter_status', Blotter.status, Blotter),
+}
+
+def dashboard_distributions(charts):
+    return union_all(*(DASHBOARD_CHARTS[chart] for chart in charts)).order_by(
+        literal_column('chart'), literal_column('category')
+    )
+
+DASHBOARD_DISTRIBUTIONS = dashboard_distributions(DASHBOARD_CHARTS)
+
+
+# Sheets of the data export, in workbook order, as (name, statement)
+
+RESIDENT_EXPORT_COLUMNS = [
+    Resident.first_name,
+    Resident.last_name,
+    Resident.middle_name,
+    Resident.suffix,
+    Resident.date_of_birth,
+    Resident.occupation,
+    Resident.civil_status,
+    Resident.citizenship,
+    Resident.sex,
+    Resident.education,
+    Resident.remarks,
+    Resident.phone1,
+    Resident.phone2,
+    Resident.email,
+    Resident.role,
+    Household.household_name,
+    Household.house_no,
+    Household.street,
+    Household.sitio,
+    Household.landmark,
+]
+
+EXPORT_SHEETS = [
+    ('RBI', select(
+        Resident.id.label("resident_id"),
+        Resident.date_added,
+        *RESIDENT_EXPORT_COLUMNS,
+        age_years().label("age"),
+    ).join(Resident.household).order_by(Resident.id)),
+
+    ('Certificates', select(
+        Resident.id.label("resident_id"),
+        Resident.first_name,
+        Resident.middle_name,
+        Resident.last_name,
+        Resident.suffix,
+        Certificate.type.label("certificate_type"),
+        Certificate.purpose.label("certificate_purpose"),
+        Certificate.date_issued,
+    ).join(Resident.certificates).order_by(Certificate.id)),
+
+    ('Blotters', select(*Blotter.__table__.columns).order_by(Blotter.id)),
+
+    ('Officials', select(
+        Resident.id.label("resident_id"),
+        *RESIDENT_EXPORT_COLUMNS,
+        User.username,
+        User.position,
+        age_years().label("age"),
+    ).join(Resident.user).join(Resident.household).order_by(Resident.id)),
+]
+
+# The tables each sheet reads from; a change to any of them puts the
+# sheet's row in a delta export (e.g. a renamed street re-exports every
+# resident of the household)
+EXPORT_SOURCES = {
+    'RBI': [Resident, Household],
+    'Certificates': [Certificate, Resident],
+    'Blotters': [Blotter],
+    'Officials': [Resident, Household, User],
+}
+
+def changed_ids(model, since):
+    return select(ChangeLog.row_id).where(
+        ChangeLog.table_name == model.__tablename__,
+        ChangeLog.seq > since
+    )
+
+def delta_sheets(since):
+    # The export sheets limited to rows changed after change_log.seq
+    # since, plus a sheet of the rows deleted since then
+    sheets = [
+        (name, stmt.where(or_(*(model.id.in_(changed_ids(model, since)) for model in EXPORT_SOURCES[name]))))
+        for name, stmt in EXPORT_SHEETS
+    ]
+    sheets.append(('Deleted', select(
+        ChangeLog.table_name,
+        ChangeLog.row_id,
+        ChangeLog.changed_at.label("deleted_at"),
+    ).where(ChangeLog.operation == 'delete', ChangeLog.seq > since).order_by(ChangeLog.seq)))
+    return sheets
@@ -3,6 +3,10 @@ from faker import Faker
 import random
 from base import Database
 from model import Resident, Household, User, Blotter, Certificate, Barangay
+import stats
+
+# Generated rows must update the dashboard totals too
+stats.install()
 
 # Initialize Faker
 fake = Faker("en_PH")  # Philippine locale
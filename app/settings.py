@@ -0,0 +1,17 @@
+from PySide6.QtCore import QSettings
+
+# Machine-local preferences (kept outside the database so they can apply
+# before it is opened)
+
+def store() -> QSettings:
+    return QSettings('BRIMA', 'BRIMA')
+
+def get(key, default=None, type=None):
+    if type is None:
+        return store().value(key, default)
+    return store().value(key, default, type=type)
+
+def put(key, value):
+    settings = store()
+    settings.setValue(key, value)
+    settings.sync()
@@ -0,0 +1,272 @@
+import threading
+from collections import Counter
+from datetime import date
+from sqlalchemy import select, delete, update, event, inspect
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+from base import Database
+from model import Resident, Household, Blotter, Certificate, DashboardChart, DashboardStat
+import queries
+
+# Dashboard statistics cache. Chart totals live in memory and in the
+# dashboard_stats table; session events turn every insert, update and
+# delete of a tracked row into +1/-1 deltas per (chart, category), so
+# opening the dashboard never re-runs the aggregates. When the previous
+# value of a changed row cannot be known without a query the affected
+# charts are only marked stale and recomputed on the next load. Age
+# buckets depend on the current date and are recomputed once a day.
+
+ENTITIES = 'entities'
+CHARTS = [ENTITIES, *queries.DASHBOARD_CHARTS]
+RESIDENT_CHARTS = {'sitio', 'age', 'sex', 'civil_status'}
+
+
+class UnknownValue(Exception):
+    pass
+
+
+def current(obj, key):
+    return getattr(obj, key)
+
+def committed(obj, key):
+    # The value as last loaded from the database
+    history = inspect(obj).attrs[key].history
+    if history.deleted:
+        return history.deleted[0]
+    if history.unchanged:
+        return history.unchanged[0]
+    if history.added:
+        raise UnknownValue(key)
+    return getattr(obj, key)
+
+
+def household_of(session, resident, old):
+    if not old:
+        return resident.household
+    household_id = committed(resident, 'household_id')
+    return session.get(Household, household_id) if household_id is not None else None
+
+def contributions(session, obj, old=False) -> Counter:
+    get = committed if old else current
+    stats = Counter()
+    today = date.today()
+
+    if isinstance(obj, Household):
+        stats[(ENTITIES, 'households')] += 1
+    elif isinstance(obj, Resident):
+        stats[(ENTITIES, 'residents')] += 1
+        household = household_of(session, obj, old)
+        sitio = get(household, 'sitio') if household is not None else None
+        if sitio is not None:
+            stats[('sitio', sitio)] += 1
+        date_of_birth = get(obj, 'date_of_birth')
+        if date_of_birth is not None:
+            stats[('age', queries.age_group_of(date_of_birth, today))] += 1
+        for chart in ('sex', 'civil_status'):
+            value = get(obj, chart)
+            if value is not None:
+                stats[(chart, value)] += 1
+    elif isinstance(obj, Blotter):
+        stats[(ENTITIES, 'blotters')] += 1
+        if get(obj, 'status') is not None:
+            stats[('blotter_status', get(obj, 'status'))] += 1
+    elif isinstance(obj, Certificate):
+        stats[(ENTITIES, 'certificates')] += 1
+
+    return stats
+
+
+class StatsCache:
+    def __init__(self):
+        self.charts = None
+        self.computed_on = {}
+        self.stale = set()
+        # load() may run on a worker thread while commits apply deltas
+        self.lock = threading.RLock()
+
+    def read(self, session):
+        self.charts = {}
+        self.computed_on = {}
+        self.stale = set()
+        for row in session.execute(select(DashboardChart)).scalars():
+            self.computed_on[row.chart] = row.computed_on
+            if row.stale:
+                self.stale.add(row.chart)
+        for chart, category, total in session.execute(
+            select(DashboardStat.chart, DashboardStat.category, DashboardStat.total)
+        ):
+            self.charts.setdefault(chart, {})[category] = total
+
+    def outdated(self) -> list:
+        today = date.today()
+        return [
+            chart for chart in CHARTS
+            if chart in self.stale
+            or chart not in self.computed_on
+            or (chart == 'age' and self.computed_on[chart] != today)
+        ]
+
+    def recompute(self, session, charts):
+        totals = {chart: {} for chart in charts}
+        if ENTITIES in charts:
+            counts = session.execute(queries.DASHBOARD_COUNTS).one()
+            totals[ENTITIES] = dict(zip(queries.DASHBOARD_ENTITIES, counts))
+        distributions = [chart for chart in charts if chart != ENTITIES]
+        if distributions:
+            for chart, category, total in session.execute(queries.dashboard_distributions(distributions)):
+                totals[chart][category] = total
+
+        today = date.today()
+        session.execute(delete(DashboardStat).where(DashboardStat.chart.in_(charts)))
+        rows = [
+            {'chart': chart, 'category': category, 'total': total}
+            for chart, categories in totals.items()
+            for category, total in categories.items()
+        ]
+        if rows:
+            session.execute(insert(DashboardStat), rows)
+        stmt = insert(DashboardChart)
+        session.execute(
+            stmt.on_conflict_do_update(
+                index_elements=[DashboardChart.chart],
+                set_={'computed_on': stmt.excluded.computed_on, 'stale': stmt.excluded.stale}
+            ),
+            [{'chart': chart, 'computed_on': today, 'stale': False} for chart in charts]
+        )
+        session.commit()
+
+        for chart in charts:
+            self.charts[chart] = totals[chart]
+            self.computed_on[chart] = today
+            self.stale.discard(chart)
+
+    def load(self, session) -> dict:
+        # A copy of chart -> {category: total}; only stale or expired charts hit the database
+        with self.lock:
+            if self.charts is None:
+                self.read(session)
+            outdated = self.outdated()
+            if outdated:
+                self.recompute(session, outdated)
+            return {chart: dict(categories) for chart, categories in self.charts.items()}
+
+    def apply(self, deltas, stale):
+        with self.lock:
+            if self.charts is not None:
+                self.update(deltas, stale)
+
+    def update(self, deltas, stale):
+        for (chart, category), delta in deltas.items():
+            categories = self.charts.setdefault(chart, {})
+            total = categories.get(category, 0) + delta
+            if total > 0:
+                categories[category] = total
+            else:
+                categories.pop(category, None)
+        self.stale |= stale
+
+    def invalidate(self):
+        # Forget everything, e.g. after another database file is opened
+        with self.lock:
+            self.charts = None
+            self.computed_on = {}
+            self.stale = set()
+
+    def mark_stale(self, session, charts):
+        # For writes that bypass the ORM, such as bulk imports
+        session.execute(update(DashboardChart).where(DashboardChart.chart.in_(charts)).values(stale=True))
+        with self.lock:
+            self.stale |= set(charts)
+
+
+cache = StatsCache()
+Database.switch_listeners.append(cache.invalidate)
+
+
+def pending(session):
+    return session.info.setdefault('dashboard_stats', {'deltas': Counter(), 'stale': set(), 'flush': None})
+
+def collect_deltas(session, flush_context, instances):
+    deltas = Counter()
+    stale = set()
+    tracked = (Household, Resident, Blotter, Certificate)
+
+    for obj in session.new:
+        if isinstance(obj, tracked):
+            deltas.update(contributions(session, obj))
+
+    for obj in session.deleted:
+        if isinstance(obj, Household):
+            # Its residents lose their sitio without being flushed themselves
+            stale.add('sitio')
+        if isinstance(obj, tracked):
+            try:
+                deltas.subtract(contributions(session, obj, old=True))
+            except UnknownValue:
+                deltas.subtract(contributions(session, obj))
+                stale |= RESIDENT_CHARTS | {'blotter_status'}
+
+    for obj in session.dirty:
+        if not isinstance(obj, tracked) or not session.is_modified(obj):
+            continue
+        if isinstance(obj, Household):
+            if inspect(obj).attrs.sitio.history.has_changes():
+                stale.add('sitio')
+            continue
+        try:
+            deltas.subtract(contributions(session, obj, old=True))
+            deltas.update(contributions(session, obj))
+        except UnknownValue:
+            stale |= RESIDENT_CHARTS if isinstance(obj, Resident) else {'blotter_status'}
+
+    pending(session)['flush'] = (Counter({key: delta for key, delta in deltas.items() if delta}), stale)
+
+def store_deltas(session, flush_context):
+    state = pending(session)
+    if state['flush'] is None:
+        return
+    deltas, stale = state['flush']
+    state['flush'] = None
+
+    if deltas:
+        stmt = insert(DashboardStat)
+        session.connection().execute(
+            stmt.on_conflict_do_update(
+                index_elements=[DashboardStat.chart, DashboardStat.category],
+                set_={'total': DashboardStat.total + stmt.excluded.total}
+            ),
+            [{'chart': chart, 'category': category, 'total': delta}
+             for (chart, category), delta in deltas.items()]
+        )
+        session.connection().execute(delete(DashboardStat).where(DashboardStat.total <= 0))
+    if stale:
+        session.connection().execute(
+            update(DashboardChart).where(DashboardChart.chart.in_(stale)).values(stale=True)
+        )
+
+    state['deltas'].update(deltas)
+    state['stale'] |= stale
+
+def apply_deltas(session):
+    state = session.info.pop('dashboard_stats', None)
+    if state:
+        cache.apply(state['deltas'], state['stale'])
+
+def discard_deltas(session):
+    session.info.pop('dashboard_stats', None)
+
+
+# (event, listener) pairs that keep the cache in step with every Session
+LISTENERS = [
+    ('before_flush', collect_deltas),
+    ('after_flush', store_deltas),
+    ('after_commit', apply_deltas),
+    ('after_rollback', discard_deltas),
+]
+
+def install():
+    # Registers the session listeners; safe to call more than once
+    for name, listener in LISTENERS:
+        if not event.contains(Session, name, listener):
+            event.listen(Session, name, listener)
+
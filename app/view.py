@@ -3,7 +3,7 @@ from PySide6.QtWidgets import (QWidget, QStackedWidget, QFormLayout, QHBoxLayout
 from PySide6.QtCore import QSize, Qt
 from PySide6.QtGui import QIcon, QPixmap, QFont
 
-from widgets import BaseWindow, AboutWindow, SettingsWindow, DashboardWindow
+from widgets import BaseWindow, CertificateWindow, AboutWindow, SettingsWindow, DashboardWindow
 
 class MainView(QWidget):
     def __init__(self):
@@ -123,7 +123,7 @@ class BrimaView(QWidget):
         self.blotter_window = BaseWindow("Blotter")
         self.stack.addWidget(self.blotter_window)
         
-        self.certificate_window = BaseWindow("Certificate")
+        self.certificate_window = CertificateWindow()
         self.stack.addWidget(self.certificate_window)
     
         self.about_window = AboutWindow()
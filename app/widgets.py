@@ -1,11 +1,114 @@
-from PySide6.QtWidgets import (QTableWidget, QWidget, QVBoxLayout, QHBoxLayout, QPushButton,
-    QLineEdit, QLabel, QTableWidgetItem, QHeaderView, QGroupBox, QTextEdit, QFormLayout, QScrollArea)
+from PySide6.QtWidgets import (QTableView, QWidget, QVBoxLayout, QHBoxLayout, QPushButton,
+    QLineEdit, QLabel, QHeaderView, QGroupBox, QTextEdit, QFormLayout, QScrollArea, QProgressBar,
+    QComboBox, QCheckBox, QSpinBox)
 from PySide6.QtGui import QIcon
-from PySide6.QtCore import QSize, Qt
+from PySide6.QtCore import QSize, Qt, QAbstractTableModel, QModelIndex
 
 import pyqtgraph as pg
 from pyqtgraph import PlotWidget
 
+# Rows sampled when sizing columns to their contents
+RESIZE_SAMPLE_ROWS = 200
+
+# Read-only grid model: rows are kept as one list per column and cells are
+# only formatted when the view asks for them. When given a pager, further
+# pages are pulled in as the view scrolls to the bottom, through the
+# fetcher the controller sets: fetcher(pager, on_page, on_error) reads the
+# page off the UI thread and hands the rows back. One page is fetched at a
+# time, and a page of a pager that has since been replaced is dropped.
+class TableModel(QAbstractTableModel):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._headers = []
+        self._columns = []
+        self._row_count = 0
+        self._pager = None
+        self._fetcher = None
+        self._fetching = False
+
+    def set_fetcher(self, fetcher):
+        self._fetcher = fetcher
+
+    def load(self, headers, data, pager=None):
+        self.beginResetModel()
+        self._headers = list(headers)
+        self._columns = [list(column) for column in zip(*data)] if data else [[] for _ in self._headers]
+        self._row_count = len(data)
+        self._pager = pager
+        self._fetching = False
+        self.endResetModel()
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return (
+            not parent.isValid() and self._pager is not None and self._fetcher is not None
+            and not self._fetching and not self._pager.exhausted
+        )
+
+    def fetchMore(self, parent=QModelIndex()):
+        if not self.canFetchMore(parent):
+            return
+        pager = self._pager
+        self._fetching = True
+        self._fetcher(pager, lambda data: self.append_page(pager, data), lambda error: self.fetch_failed(pager))
+
+    def append_page(self, pager, data):
+        if pager is not self._pager:
+            return
+        self._fetching = False
+        if not data:
+            return
+
+        self.beginInsertRows(QModelIndex(), self._row_count, self._row_count + len(data) - 1)
+        for column, values in zip(self._columns, zip(*data)):
+            column.extend(values)
+        self._row_count += len(data)
+        self.endInsertRows()
+
+    def fetch_failed(self, pager):
+        if pager is self._pager:
+            self._fetching = False
+
+    def is_complete(self):
+        return self._pager is None or self._pager.exhausted
+
+    def filter_rows(self, column, predicate):
+        # Keeps the loaded rows whose value in column passes predicate
+        if not self._row_count:
+            # Nothing to narrow; an empty load has no hidden columns either
+            return
+        keep = [row for row, value in enumerate(self._columns[column]) if predicate(value)]
+        self.beginResetModel()
+        self._columns = [[values[row] for row in keep] for values in self._columns]
+        self._row_count = len(keep)
+        self.endResetModel()
+
+    def row_id(self, row):
+        if not 0 <= row < self._row_count:
+            raise IndexError("No row selected")
+        return int(self._columns[0][row])
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self._row_count
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._headers)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        if role == Qt.DisplayRole:
+            return str(self._columns[index.column()][index.row()])
+        if role == Qt.TextAlignmentRole:
+            return Qt.AlignCenter
+        return None
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return None
+        if orientation == Qt.Horizontal:
+            return self._headers[section] if section < len(self._headers) else None
+        return section + 1
+
 class BaseWindow(QWidget):
     def __init__(self, title):
         super().__init__()
@@ -51,12 +154,20 @@ class BaseWindow(QWidget):
         self.btRefresh.setIconSize(icon_size)
         self.lbTotal = QLabel("Total: ")
 
+        # Shown while the list is being loaded in the background
+        self.busy = QProgressBar()
+        self.busy.setRange(0, 0)
+        self.busy.setMaximumWidth(120)
+        self.busy.setTextVisible(False)
+        self.busy.setVisible(False)
+
         top_bar_layout.addWidget(self.btAdd)
         top_bar_layout.addWidget(self.btEdit)
         top_bar_layout.addWidget(self.btDelete)
         top_bar_layout.addWidget(self.btBrowse)
         top_bar_layout.addWidget(self.btRefresh)
         top_bar_layout.addWidget(self.lbTotal)
+        top_bar_layout.addWidget(self.busy)
         top_bar_layout.addStretch()
         
         main_layout.addWidget(top_bar)
@@ -95,37 +206,38 @@ class BaseWindow(QWidget):
         
         main_layout.addWidget(filter)
         
-        self.table = QTableWidget()
+        self.model = TableModel(self)
+        self.table = QTableView()
         self.table.setObjectName('table')
+        self.table.setModel(self.model)
         
         self.table.verticalHeader().setVisible(True)
-        self.table.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)
-        self.table.setSelectionBehavior(QTableWidget.SelectionBehavior.SelectRows)
+        self.table.setEditTriggers(QTableView.EditTrigger.NoEditTriggers)
+        self.table.setSelectionBehavior(QTableView.SelectionBehavior.SelectRows)
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Interactive)
+        self.table.horizontalHeader().setResizeContentsPrecision(RESIZE_SAMPLE_ROWS)
+        self.table.horizontalHeader().setStretchLastSection(True)
         
         main_layout.addWidget(self.table)
         
-    def load_table(self, headers, data):
-        self.table.clearContents()
-        self.table.setRowCount(len(data))
-        self.table.setColumnCount(len(headers))
+    def load_table(self, headers, data, pager=None):
+        self.model.load(headers, data, pager)
         self.table.setColumnHidden(0, True)
-        self.table.setHorizontalHeaderLabels(headers)
-        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeToContents)
-        self.table.horizontalHeader().setStretchLastSection(True)
-
-        if not data:
-            return
-        
-        for row, row_data in enumerate(data):
-            for col, col_data in enumerate(row_data):
-                item = QTableWidgetItem(str(col_data))
-                item.setTextAlignment(Qt.AlignCenter)
-                self.table.setItem(row, col, item)
+        self.table.resizeColumnsToContents()
     
     def get_table_row(self):
-        selected_row = self.table.currentRow()
-        return int(self.table.item(selected_row, 0).text())
+        return self.model.row_id(self.table.currentIndex().row())
+
+    def get_selected_rows(self):
+        return [self.model.row_id(index.row()) for index in self.table.selectionModel().selectedRows()]
         
+    def set_busy(self, busy):
+        self.busy.setVisible(busy)
+        if busy:
+            self.setCursor(Qt.BusyCursor)
+        else:
+            self.unsetCursor()
+
     def get_search_text(self):
         return self.tbSearchBar.text()
     
@@ -152,6 +264,22 @@ class AboutMember(QGroupBox):
         self.tbMember.setText(member)
         self.tbPosition.setText(position)
 
+class CertificateWindow(BaseWindow):
+    def __init__(self):
+        super().__init__("Certificate")
+
+        self.btPrintBatch = QPushButton("Print Batch")
+        self.btPrintBatch.setObjectName("btPrintBatch")
+        self.btPrintBatch.setIcon(QIcon(":/browse"))
+        self.btPrintBatch.setIconSize(QSize(24, 24))
+        self.pbPrintBatch = QProgressBar()
+        self.pbPrintBatch.setMaximumWidth(160)
+        self.pbPrintBatch.setVisible(False)
+
+        top_bar_layout = self.btRefresh.parentWidget().layout()
+        top_bar_layout.insertWidget(top_bar_layout.indexOf(self.btRefresh) + 1, self.btPrintBatch)
+        top_bar_layout.insertWidget(top_bar_layout.indexOf(self.busy) + 1, self.pbPrintBatch)
+
 class AboutWindow(QWidget):
     def __init__(self):
         super().__init__()
@@ -285,11 +413,36 @@ class SettingsWindow(QWidget):
         self.export_csv = QGroupBox('Export')
         export_csv_layout = QVBoxLayout(self.export_csv)
 
-        self.btExport = QPushButton('Export Data to XLSX')
+        self.cbExportFormat = QComboBox()
+        self.btExport = QPushButton('Export Data')
+        self.pbExport = QProgressBar()
+        self.pbExport.setVisible(False)
+        export_options = QWidget()
+        export_options_layout = QFormLayout(export_options)
+        export_options_layout.addRow('Format: ', self.cbExportFormat)
+        self.chkDeltaExport = QCheckBox('Only rows changed since the last export')
+        self.lbLastExport = QLabel()
+        export_options_layout.addRow(self.chkDeltaExport)
+        export_options_layout.addRow('Last export: ', self.lbLastExport)
+        export_csv_layout.addWidget(export_options)
         export_csv_layout.addWidget(self.btExport)
+        export_csv_layout.addWidget(self.pbExport)
 
         scroll_layout.addWidget(self.export_csv)
 
+        # Bulk import of residents
+        self.import_data = QGroupBox('Import')
+        import_layout = QVBoxLayout(self.import_data)
+        self.lbImport = QLabel("Imports residents from an RBI sheet laid out like the export (XLSX or CSV).")
+        self.btImport = QPushButton('Import Residents')
+        self.pbImport = QProgressBar()
+        self.pbImport.setVisible(False)
+        import_layout.addWidget(self.lbImport)
+        import_layout.addWidget(self.btImport)
+        import_layout.addWidget(self.pbImport)
+
+        scroll_layout.addWidget(self.import_data)
+
         #Database Backup
         self.backup = QGroupBox('Data Backup')
         backup_layout = QVBoxLayout(self.backup)
@@ -298,12 +451,41 @@ class SettingsWindow(QWidget):
         )
         self.btCreateBackup = QPushButton('Create Backup')
         self.btViewBackup = QPushButton('Switch to Backup')
+        self.btRestoreSnapshot = QPushButton('Restore Automatic Backup')
+        self.cbCompression = QComboBox()
+        self.chkCompact = QCheckBox('Compact the backup (slower, smaller file)')
+        self.pbBackup = QProgressBar()
+        self.pbBackup.setVisible(False)
+        self.sbBackupInterval = QSpinBox()
+        self.sbBackupInterval.setRange(0, 24 * 60)
+        self.sbBackupInterval.setSuffix(' min')
+        self.sbBackupInterval.setSpecialValueText('Off')
+        backup_options = QWidget()
+        backup_options_layout = QFormLayout(backup_options)
+        backup_options_layout.addRow('Compression: ', self.cbCompression)
+        backup_options_layout.addRow(self.chkCompact)
+        backup_options_layout.addRow('Automatic backup every: ', self.sbBackupInterval)
         backup_layout.addWidget(self.warning_label)
+        backup_layout.addWidget(backup_options)
         backup_layout.addWidget(self.btCreateBackup)
+        backup_layout.addWidget(self.pbBackup)
         backup_layout.addWidget(self.btViewBackup)
+        backup_layout.addWidget(self.btRestoreSnapshot)
 
         scroll_layout.addWidget(self.backup)
 
+        # Database performance profile
+        self.performance = QGroupBox('Database Performance')
+        performance_layout = QFormLayout(self.performance)
+        self.cbProfile = QComboBox()
+        self.lbProfile = QLabel()
+        self.btApplyProfile = QPushButton('Apply Profile')
+        performance_layout.addRow('Profile: ', self.cbProfile)
+        performance_layout.addRow('Settings: ', self.lbProfile)
+        performance_layout.addRow(self.btApplyProfile)
+
+        scroll_layout.addWidget(self.performance)
+
         
         # Set the content widget to the scroll area
         scroll_area.setWidget(scroll_content)
@@ -6,7 +6,8 @@ from PySide6.QtCore import QDate
 from sqlalchemy.orm import Session
 from model import Barangay, Household, Resident, User 
 import sys
-import bcrypt
+from workers import Worker
+import auth
 
 class BarangayPage(QWizardPage):
     def __init__(self):
@@ -207,8 +208,25 @@ class InitWizard(QWizard):
         self.addPage(self.user_page)
 
         self.setWindowTitle("Application Initial Setup")
+        self.worker = Worker(self)
 
     def accept(self):
+        # The first hash also calibrates the bcrypt cost for this machine,
+        # so it runs on the worker and the data is saved when it is done
+        password = self.user_page.tbPassword.text().strip()
+        self.button(QWizard.FinishButton).setEnabled(False)
+        self.worker.submit(
+            'hash_password',
+            lambda session: auth.hash_password(password),
+            self.save,
+            self.hash_failed
+        )
+
+    def hash_failed(self, error):
+        self.button(QWizard.FinishButton).setEnabled(True)
+        QMessageBox.critical(self, "Error", f"Could not hash the password: {str(error)}")
+
+    def save(self, password):
         # Gather all the data from pages
         barangay_name = f"BARANGAY {self.barangay_page.name_edit.text().strip()}".upper()
         barangay_history = self.barangay_page.history_edit.toPlainText().strip().upper()
@@ -240,8 +258,6 @@ class InitWizard(QWizard):
 
         # User fields (username and password as is, position upper)
         username = self.user_page.tbUserName.text().strip()
-        salt = bcrypt.gensalt()
-        password = bcrypt.hashpw(self.user_page.tbPassword.text().strip().encode('utf-8'), salt)
         position = self.user_page.cbPosition.currentText().strip().upper()
 
         # Save to DB
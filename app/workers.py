@@ -0,0 +1,108 @@
+from PySide6.QtCore import QObject, QRunnable, QThreadPool, Signal, Slot
+from base import Database
+
+# Runs database work on a QThreadPool so the UI thread never waits on
+# SQLite. Sessions are not thread-safe, so every job runs as a unit of
+# work on its pool thread's own session. Results are delivered back on the
+# UI thread through queued signals.
+#
+# Jobs are submitted on a named channel; submitting again on the same
+# channel cancels the previous job: if it has not started it never runs,
+# and if it has, its result is dropped. A superseded search therefore never
+# overwrites newer results.
+
+class TaskSignals(QObject):
+    # (task, result, error); emitted once for every task, even cancelled ones
+    done = Signal(object, object, object)
+    # (task, progress arguments)
+    progress = Signal(object, object)
+
+class Task(QRunnable):
+    def __init__(self, job, on_result, on_error, on_progress=None):
+        super().__init__()
+        self.job = job
+        self.on_result = on_result
+        self.on_error = on_error
+        self.on_progress = on_progress
+        self.cancelled = False
+        self.signals = TaskSignals()
+
+    def cancel(self):
+        self.cancelled = True
+
+    def report(self, *args):
+        self.signals.progress.emit(self, args)
+
+    def run(self):
+        result = error = None
+        if not self.cancelled:
+            try:
+                with Database().unit_of_work() as session:
+                    if self.on_progress is None:
+                        result = self.job(session)
+                    else:
+                        result = self.job(session, self.report)
+            except Exception as e:
+                error = e
+        self.signals.done.emit(self, result, error)
+
+
+class Worker(QObject):
+    busy_changed = Signal(bool)
+
+    def __init__(self, parent=None, pool: QThreadPool = None):
+        super().__init__(parent)
+        self.pool = pool or QThreadPool.globalInstance()
+        self.channels = {}
+        self.running = set()
+
+    def submit(self, channel, job, on_result=None, on_error=None, on_progress=None) -> Task:
+        # job(session) runs on a pool thread; on_result(result) and
+        # on_error(exception) run on the UI thread. With on_progress the job
+        # is called as job(session, report) and every report(*args) reaches
+        # on_progress(*args) on the UI thread.
+        previous = self.channels.get(channel)
+        if previous is not None:
+            previous.cancel()
+
+        task = Task(job, on_result, on_error, on_progress)
+        task.signals.done.connect(self.finish)
+        task.signals.progress.connect(self.progress)
+        self.channels[channel] = task
+        self.running.add(task)
+        if len(self.running) == 1:
+            self.busy_changed.emit(True)
+        self.pool.start(task)
+        return task
+
+    def cancel(self, channel):
+        task = self.channels.pop(channel, None)
+        if task is not None:
+            task.cancel()
+
+    @Slot(object, object)
+    def progress(self, task, args):
+        if not task.cancelled and task.on_progress is not None:
+            task.on_progress(*args)
+
+    @Slot(object, object, object)
+    def finish(self, task, result, error):
+        if task not in self.running:
+            return
+        self.running.discard(task)
+        for channel, current in list(self.channels.items()):
+            if current is task:
+                del self.channels[channel]
+
+        if not self.running:
+            self.busy_changed.emit(False)
+
+        if task.cancelled:
+            return
+        if error is not None:
+            if task.on_error is not None:
+                task.on_error(error)
+            else:
+                raise error
+        elif task.on_result is not None:
+            task.on_result(result)
@@ -0,0 +1,98 @@
+from datetime import date
+import pytest
+from sqlalchemy import create_engine, event, desc
+from sqlalchemy.orm import Session
+from base import Base
+from model import Household, Resident, User, Certificate
+import queries
+
+# A list window's refresh is the first page query, plus one COUNT when the
+# window shows the total, however many rows there are: names and addresses
+# come from the page query itself, with no lazy load per row.
+
+
+def seed(session, count):
+    household = Household(household_name='HOUSEHOLD', house_no='1', street='MAIN', sitio='CENTRO')
+    session.add(household)
+    for number in range(count):
+        resident = Resident(
+            first_name=f'FIRST{number}', last_name=f'LAST{number}', middle_name='M',
+            date_of_birth=date(1990, 1, 1), household=household
+        )
+        session.add_all([
+            resident,
+            User(username=f'user{number}', password=b'x', position='CLERK', resident=resident),
+            Certificate(date_issued=date(2025, 1, 1), type='CLEARANCE', purpose='WORK', resident=resident),
+        ])
+    session.commit()
+
+
+@pytest.fixture
+def session():
+    engine = create_engine('sqlite://')
+    Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        yield session
+    engine.dispose()
+
+
+def count_selects(session):
+    statements = []
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT'):
+            statements.append(statement)
+    event.listen(session.get_bind(), 'before_cursor_execute', before_cursor_execute)
+    return statements
+
+
+# The list windows' default filters
+LISTS = {
+    'residents': (
+        queries.RESIDENT_ROWS,
+        lambda session: session.query(Resident).outerjoin(Resident.household).order_by(Resident.last_name),
+    ),
+    'users': (
+        queries.USER_ROWS,
+        lambda session: session.query(User).outerjoin(User.resident).order_by(User.id, User.date_added),
+    ),
+    'certificates': (
+        queries.CERTIFICATE_ROWS,
+        lambda session: session.query(Certificate).outerjoin(Certificate.resident).order_by(desc(Certificate.date_issued)),
+    ),
+}
+
+
+@pytest.mark.parametrize('count', [1, 25, 150])
+@pytest.mark.parametrize('name', LISTS)
+def test_first_page_is_one_select(session, name, count):
+    seed(session, count)
+    rows, default_filter = LISTS[name]
+    session.expunge_all()
+
+    statements = count_selects(session)
+    data = rows.pager(default_filter(session)).next_page(session)
+
+    assert len(data) == count
+    assert len(statements) == 1
+    assert 'count(' not in statements[0].lower()
+    assert all(isinstance(row, tuple) for row in data)
+
+
+@pytest.mark.parametrize('count', [1, 25, 150])
+@pytest.mark.parametrize('name', LISTS)
+def test_refresh_with_total_adds_one_count(session, name, count):
+    seed(session, count)
+    rows, default_filter = LISTS[name]
+    session.expunge_all()
+
+    statements = count_selects(session)
+    pager = rows.pager(default_filter(session))
+    data = pager.next_page(session)
+    total = pager.count(session)
+    # Counted once per pager
+    pager.count(session)
+
+    assert len(data) == count
+    assert total == count
+    assert len(statements) == 2
+    assert 'count(' in statements[1].lower()